@@ -1,12 +1,24 @@
 import os
 import sys
+import argparse
+import asyncio
 import re
 import json
 import time
+import mmap
+import zlib
+import threading
+import random
 import traceback
-from typing import List, Dict, Any, Tuple, Optional
-from dataclasses import dataclass
-from collections import defaultdict
+from typing import List, Dict, Any, Tuple, Optional, Callable, Iterator
+from dataclasses import dataclass, fields, field, make_dataclass
+from array import array
+import tracemalloc
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from collections import defaultdict, Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import nltk
 from nltk.tokenize import sent_tokenize
 from dotenv import load_dotenv
@@ -15,12 +27,23 @@ from PyPDF2 import PdfReader
 from pinecone import Pinecone, ServerlessSpec
 import docx2txt
 import hashlib
+import zipfile
+import xml.etree.ElementTree as ET
+import sqlite3
+import socket
+try:
+    import fcntl
+except ImportError:  # Windows: rely on a single writer per store
+    fcntl = None
 
-# Download NLTK resources
+# Download NLTK resources (only when missing, so repeated runs skip the network check)
 try:
-    nltk.download('punkt', quiet=True)
-except Exception:
-    print("Warning: Could not download NLTK punkt. Sentence tokenization might be affected.")
+    nltk.data.find('tokenizers/punkt')
+except LookupError:
+    try:
+        nltk.download('punkt', quiet=True)
+    except Exception:
+        print("Warning: Could not download NLTK punkt. Sentence tokenization might be affected.")
 
 # Load environment variables from .env file
 load_dotenv()
@@ -36,9 +59,9 @@ if not PINECONE_API_KEY or not GOOGLE_API_KEY:
 genai.configure(api_key=GOOGLE_API_KEY)
 pc = Pinecone(api_key=PINECONE_API_KEY)
 
-@dataclass
+@dataclass(slots=True)
 class TextChunk:
-    """Represents a text chunk with metadata"""
+    """Represents a text chunk with metadata (slotted, so no per-instance __dict__)"""
     text: str
     page_num: int = 0
     section: str = ""
@@ -75,46 +98,1193 @@ class TextChunk:
         return TextChunk(
             text=data["text"],
             page_num=data.get("page_num"),
-            section=data.get("section"),
+            section=_intern(data.get("section")),
             position=data.get("position"),
             chunk_type=data.get("chunk_type", "text"),
-            chapter=data.get("chapter"),
+            chapter=_intern(data.get("chapter")),
             subsection=data.get("subsection"),
             importance_score=data.get("importance_score", 0.0),
             mcq_data=data.get("mcq_data")
         )
 
 
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Intern repeated label strings so every chunk shares one copy"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class StringTable:
+    """Integer codes for repeated strings; code 0 is the empty string, which also stands for None"""
+    
+    __slots__ = ('values', '_codes')
+
+    def __init__(self):
+        self.values: List[str] = [""]
+        self._codes: Dict[str, int] = {"": 0}
+
+    def code(self, value: Optional[str]) -> int:
+        if not value:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __getitem__(self, code: int) -> str:
+        return self.values[code]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ChunkBatch:
+    """
+    Columnar form of a list of chunks
+    
+    Numeric fields live in typed arrays and chapter/section are integer codes
+    into shared StringTables, so a batch costs a few bytes per chunk beyond
+    the text itself. metadata() builds the index payload for one row directly,
+    without the to_dict/cleaning copies.
+    """
+    
+    __slots__ = ('texts', 'page_nums', 'positions', 'importance_scores', 'chunk_types',
+                 'chapter_codes', 'section_codes', 'subsections', 'mcq_data', 'chapters', 'sections')
+
+    def __init__(self, chapters: StringTable = None, sections: StringTable = None):
+        self.texts: List[str] = []
+        self.page_nums = array('i')
+        self.positions = array('i')
+        self.importance_scores = array('d')
+        self.chunk_types: List[str] = []
+        self.chapter_codes = array('i')
+        self.section_codes = array('i')
+        self.subsections: List[str] = []
+        # Sparse: only MCQ rows carry data
+        self.mcq_data: Dict[int, Dict[str, Any]] = {}
+        self.chapters = chapters if chapters is not None else StringTable()
+        self.sections = sections if sections is not None else StringTable()
+
+    @classmethod
+    def from_chunks(cls, chunks: List[TextChunk], chapters: StringTable = None,
+                    sections: StringTable = None) -> 'ChunkBatch':
+        batch = cls(chapters, sections)
+        for chunk in chunks:
+            batch.append(chunk)
+        return batch
+
+    @classmethod
+    def group_by_chapter(cls, chunks: List[TextChunk]) -> Dict[str, 'ChunkBatch']:
+        """
+        Split chunks into one batch per chapter, in first-seen order
+        
+        The batches share their label tables, and each list slot is cleared
+        once its chunk is copied, so the TextChunk objects are freed as the
+        batches grow instead of being held alongside them.
+        """
+        chapters, sections = StringTable(), StringTable()
+        batches: Dict[str, ChunkBatch] = {}
+        for i, chunk in enumerate(chunks):
+            chapter = chunk.chapter or 'default'
+            batch = batches.get(chapter)
+            if batch is None:
+                batch = batches[chapter] = cls(chapters, sections)
+            batch.append(chunk)
+            chunks[i] = None
+        chunks.clear()
+        return batches
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def append(self, chunk: TextChunk) -> None:
+        row = len(self.texts)
+        self.texts.append(chunk.text)
+        self.page_nums.append(chunk.page_num or 0)
+        self.positions.append(chunk.position or 0)
+        self.importance_scores.append(chunk.importance_score or 0.0)
+        self.chunk_types.append(sys.intern(chunk.chunk_type or "text"))
+        self.chapter_codes.append(self.chapters.code(chunk.chapter))
+        self.section_codes.append(self.sections.code(chunk.section))
+        self.subsections.append(chunk.subsection or "")
+        if chunk.mcq_data:
+            self.mcq_data[row] = chunk.mcq_data
+
+    def chunk(self, row: int) -> TextChunk:
+        """Materialise one row as a TextChunk"""
+        return TextChunk(
+            text=self.texts[row],
+            page_num=self.page_nums[row],
+            section=self.sections[self.section_codes[row]],
+            position=self.positions[row],
+            chunk_type=self.chunk_types[row],
+            chapter=self.chapters[self.chapter_codes[row]],
+            subsection=self.subsections[row],
+            importance_score=self.importance_scores[row],
+            mcq_data=self.mcq_data.get(row)
+        )
+
+    def metadata(self, row: int, **extra: Any) -> Dict[str, Any]:
+        """Index metadata for one row, with None fields stored as empty strings"""
+        metadata = {
+            "text": self.texts[row],
+            "page_num": self.page_nums[row],
+            "section": self.sections[self.section_codes[row]],
+            "position": self.positions[row],
+            "chunk_type": self.chunk_types[row],
+            "chapter": self.chapters[self.chapter_codes[row]],
+            "subsection": self.subsections[row],
+            "importance_score": self.importance_scores[row]
+        }
+        if row in self.mcq_data:
+            metadata["mcq_data"] = self.mcq_data[row]
+        metadata.update(extra)
+        return metadata
+
+
+def _measure(build: Callable[[], Any]) -> Tuple[Any, int, int, float]:
+    """Run build() and return (result, bytes still allocated, peak bytes, seconds)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated, peak, elapsed
+
+
+def benchmark_chunk_memory(chunks: List[TextChunk] = None, num_chunks: int = 100_000) -> List[Dict[str, Any]]:
+    """
+    Compare memory held by the chunk representations and by payload building
+    
+    Uses the given chunks, or synthetic ones spread over 20 chapters of 25
+    sections each. Chapter and section strings are copied per chunk, as they
+    are after a JSON round-trip, so each form pays for whatever sharing it
+    does not do. The chunk text is the same object in every form and is not
+    counted. The ingest row is what process_document holds while embedding:
+    per-chapter batches, with the TextChunks freed as they are copied. Payloads are built one at a time and dropped, as the upsert
+    stage consumes them, so those rows show allocation churn (peak and time)
+    rather than retained size.
+    """
+    if chunks is None:
+        chunks = [
+            TextChunk(
+                text=f"Paragraph {i} about displacement, velocity and acceleration.",
+                page_num=i // 20 + 1,
+                section=f"{i // 200 % 25 + 1}.{i % 7} Section on motion in a straight line",
+                position=i,
+                chapter=f"Chapter {i // 5000 + 1}: Kinematics and Dynamics of Particles",
+                subsection=f"Part {i % 3 + 1}/3" if i % 5 == 0 else ""
+            )
+            for i in range(num_chunks)
+        ]
+    
+    def fresh(value: Optional[str]) -> Optional[str]:
+        # A new string object with the same contents
+        return value[:1] + value[1:] if value else value
+    
+    def build_chunks(chunk_class, label=fresh):
+        return [
+            chunk_class(chunk.text, chunk.page_num, label(chunk.section), chunk.position, chunk.chunk_type,
+                        label(chunk.chapter), chunk.subsection, chunk.importance_score, chunk.mcq_data)
+            for chunk in chunks
+        ]
+    
+    def ingest_batches():
+        return ChunkBatch.group_by_chapter(build_chunks(TextChunk))
+    
+    def legacy_payloads():
+        built = 0
+        for i, chunk in enumerate(chunks):
+            chunk_data = chunk.to_dict()
+            cleaned = {key: ("" if value is None else value) for key, value in chunk_data.items()}
+            payload = {**cleaned, "book_id": "book", "chunk_id": i, "timestamp": 0.0}
+            built += len(payload)
+        return built
+    
+    def batch_payloads():
+        built = 0
+        for i in range(len(batch)):
+            payload = batch.metadata(i, book_id="book", chunk_id=i, timestamp=0.0)
+            built += len(payload)
+        return built
+    
+    # The pre-slots layout, for comparison
+    PlainChunk = make_dataclass(
+        'PlainChunk', [(f.name, f.type, field(default=f.default)) for f in fields(TextChunk)]
+    )
+    batch = ChunkBatch.from_chunks(chunks)
+    cases = [
+        ("plain dataclass", lambda: build_chunks(PlainChunk)),
+        ("slots dataclass", lambda: build_chunks(TextChunk)),
+        ("slots + interned labels", lambda: build_chunks(TextChunk, lambda value: _intern(fresh(value)))),
+        ("chapter ChunkBatches (ingest)", ingest_batches),
+        ("payloads via to_dict", legacy_payloads),
+        ("payloads via ChunkBatch", batch_payloads),
+    ]
+    
+    report = []
+    for name, build in cases:
+        result, allocated, peak, elapsed = _measure(build)
+        report.append({
+            "representation": name,
+            "chunks": len(chunks),
+            "bytes": allocated,
+            "bytes_per_chunk": round(allocated / len(chunks), 1) if chunks else 0,
+            "peak_bytes": peak,
+            "seconds": round(elapsed, 3)
+        })
+        del result
+    return report
+
+
+class SidecarTextStore:
+    """Compressed, memory-mapped local store for chunk payloads keyed by vector ID
+
+    Records are appended to ``<path>.dat`` as zlib-compressed JSON and their
+    offsets to ``<path>.idx`` (one ``id\toffset\tlength`` line per record), so
+    writers never rewrite existing data and readers in other processes can pick
+    up new records by reading the index tail. Appends hold an exclusive file
+    lock, so the worker and CLI imports can write the same store; where fcntl
+    is unavailable there must be a single writer per store.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data_path = f"{path}.dat"
+        self.index_path = f"{path}.idx"
+        self._lock = threading.Lock()
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._index_read_pos = 0
+        self._mmap = None
+        self._mapped_size = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        open(self.data_path, 'ab').close()
+        open(self.index_path, 'ab').close()
+        self._refresh_index()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """Check whether a store has been written at the given path"""
+        return os.path.exists(f"{path}.dat") and os.path.exists(f"{path}.idx")
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _refresh_index(self) -> None:
+        """Read index lines appended since the last refresh"""
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_read_pos)
+            tail = f.read()
+        # Only consume complete lines; a concurrent writer may be mid-line
+        end = tail.rfind(b'\n') + 1
+        for line in tail[:end].decode('utf-8').splitlines():
+            vector_id, offset, length = line.rsplit('\t', 2)
+            self._offsets[vector_id] = (int(offset), int(length))
+        self._index_read_pos += end
+
+    def _view(self) -> Optional[mmap.mmap]:
+        """Return a read-only map of the data file, remapping if it has grown"""
+        size = os.path.getsize(self.data_path)
+        if size == 0:
+            return None
+        if self._mmap is None or size > self._mapped_size:
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.data_path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_size = size
+        return self._mmap
+
+    def put_many(self, records: Dict[str, Dict[str, Any]]) -> None:
+        """Append payloads for a batch of vector IDs"""
+        if not records:
+            return
+        blobs = [
+            (vector_id, zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8')))
+            for vector_id, payload in records.items()
+        ]
+        with self._lock, open(self.data_path, 'ab') as f:
+            # The lock is released when the data file is closed
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            # Pick up other writers' records first; our own lines are read back on a later refresh
+            self._refresh_index()
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            index_lines = []
+            for vector_id, blob in blobs:
+                f.write(blob)
+                self._offsets[vector_id] = (offset, len(blob))
+                index_lines.append(f"{vector_id}\t{offset}\t{len(blob)}\n")
+                offset += len(blob)
+            f.flush()
+            with open(self.index_path, 'ab') as index_file:
+                index_file.write(''.join(index_lines).encode('utf-8'))
+
+    def get_many(self, vector_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch payloads for many vector IDs in a single pass over the map"""
+        with self._lock:
+            if any(vector_id not in self._offsets for vector_id in vector_ids):
+                self._refresh_index()
+            view = self._view()
+            if view is None:
+                return {}
+            # Read in file order so the pages we touch are sequential
+            located = sorted(
+                (self._offsets[vector_id], vector_id)
+                for vector_id in set(vector_ids) if vector_id in self._offsets
+            )
+            return {
+                vector_id: json.loads(zlib.decompress(view[offset:offset + length]))
+                for (offset, length), vector_id in located
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+                self._mapped_size = 0
+
+
+class EmbeddingArchive:
+    """
+    Quantized on-disk archive of stored vectors with their IDs and metadata
+    
+    Vectors are kept as int8 with a per-vector scale factor, or as float16,
+    so a book can be moved to another index or namespace without paying for
+    the embeddings again.
+    """
+    
+    FORMAT_VERSION = 1
+    SUPPORTED_DTYPES = ("int8", "float16")
+
+    def __init__(self, ids: List[str], namespaces: List[str], vectors: np.ndarray,
+                 metadata: List[Dict[str, Any]]):
+        self.ids = list(ids)
+        self.namespaces = list(namespaces)
+        self.vectors = np.asarray(vectors, dtype=np.float32).reshape(len(self.ids), -1) if self.ids \
+            else np.zeros((0, 0), dtype=np.float32)
+        self.metadata = list(metadata)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def quantize(vectors: np.ndarray, dtype: str = "int8") -> Tuple[np.ndarray, np.ndarray]:
+        """Quantize float vectors, returning the stored values and per-vector scales"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if dtype == "float16":
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+        if dtype == "int8":
+            # Symmetric per-vector scaling keeps the direction, which is all cosine needs
+            scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+            scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+            quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+            return quantized, scales
+        raise ValueError(f"Unsupported archive dtype: {dtype}")
+
+    @staticmethod
+    def dequantize(values: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        """Restore float32 vectors from stored values and scales"""
+        return values.astype(np.float32) * scales[:, None]
+
+    def save(self, path: str, dtype: str = "int8") -> None:
+        """Write the archive as a compressed .npz file"""
+        values, scales = self.quantize(self.vectors, dtype)
+        np.savez_compressed(
+            path,
+            format_version=np.array(self.FORMAT_VERSION),
+            dtype=np.array(dtype),
+            ids=np.array(self.ids, dtype=np.str_),
+            namespaces=np.array(self.namespaces, dtype=np.str_),
+            values=values,
+            scales=scales,
+            metadata=np.array(json.dumps(self.metadata, separators=(',', ':')))
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'EmbeddingArchive':
+        """Read an archive written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["format_version"])
+            if version != cls.FORMAT_VERSION:
+                raise ValueError(f"Unsupported archive format version: {version}")
+            return cls(
+                ids=data["ids"].tolist(),
+                namespaces=data["namespaces"].tolist(),
+                vectors=cls.dequantize(data["values"], data["scales"]),
+                metadata=json.loads(str(data["metadata"]))
+            )
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    """Best-effort HTTP status code of an API client exception"""
+    for attr in ('status', 'status_code', 'code'):
+        value = getattr(error, attr, None)
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                value = None
+        if isinstance(value, int):
+            return value
+        if hasattr(value, 'value') and isinstance(value.value, int):
+            return value.value
+    # Fall back to codes at the start of the message or labelled as a status
+    match = re.search(r'^\(?([45]\d\d)\b|status(?: code)?\W*([45]\d\d)\b', str(error), re.IGNORECASE)
+    return int(match.group(1) or match.group(2)) if match else None
+
+
+def _is_payload_too_large(error: Exception) -> bool:
+    """Whether an upsert failed because the request was too big"""
+    message = str(error).lower()
+    return _error_status(error) == 413 or any(
+        phrase in message for phrase in ('request size', 'message length', 'payload too large', 'request entity too large')
+    )
+
+
+def _is_vector_error(error: Exception) -> bool:
+    """Whether an upsert was rejected for its contents, which splitting can narrow down to the bad vectors"""
+    if _is_payload_too_large(error):
+        return True
+    status = _error_status(error)
+    if status is not None:
+        return status in (400, 422)
+    # Client-side validation of a malformed vector
+    return isinstance(error, (ValueError, TypeError))
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether an API error is worth retrying as-is (throttling, server or network trouble)"""
+    status = _error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    message = str(error).lower()
+    return isinstance(error, (TimeoutError, ConnectionError)) or any(
+        phrase in message for phrase in ('timeout', 'timed out', 'temporarily', 'unavailable', 'connection')
+    )
+
+
+def _is_throttled(error: Exception) -> bool:
+    """Whether an API error means a rate limit or quota was hit"""
+    if _error_status(error) == 429:
+        return True
+    message = str(error).lower()
+    return any(phrase in message for phrase in ('resource exhausted', 'resource_exhausted', 'rate limit', 'quota'))
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether a failed call may succeed if repeated; client errors other than 408/429 never will"""
+    status = _error_status(error)
+    return status is None or status in (408, 429) or status >= 500
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from a Retry-After header or a retry hint in the error"""
+    for source in (error, getattr(error, 'response', None)):
+        headers = getattr(source, 'headers', None)
+        if not headers:
+            continue
+        try:
+            value = headers.get('Retry-After') or headers.get('retry-after')
+        except Exception:
+            value = None
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            pass
+        try:
+            from email.utils import parsedate_to_datetime
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except Exception:
+            pass
+    # Gemini reports the delay in the message, e.g. "Please retry in 41.3s" or "retry_delay { seconds: 41 }";
+    # other clients may echo the header as "Retry-After: 5". Nothing else counts as a hint.
+    message = str(error)
+    match = re.search(r'\bretry in (\d+(?:\.\d+)?)\s*(ms|s|sec|seconds?)\b', message, re.IGNORECASE)
+    if match:
+        seconds = float(match.group(1))
+        return seconds / 1000 if match.group(2).lower() == 'ms' else seconds
+    match = (re.search(r'\bretry_delay\s*\{\s*seconds:\s*(\d+)', message)
+             or re.search(r'\bretry-after:\s*(\d+(?:\.\d+)?)', message, re.IGNORECASE))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class RateGovernor:
+    """
+    Request pacing shared by every thread and stage that calls one API
+    
+    Requests draw from a token bucket refilled at the current rate. Each
+    success raises the rate additively (about increase requests/s per second
+    at steady state) and each throttling error cuts it multiplicatively, at
+    most once per backoff window so a burst of 429s from requests already in
+    flight counts as one signal. A Retry-After hint stops the bucket refilling
+    until it expires, so callers queued behind it are released one token
+    interval apart rather than all at once. Retries are drawn from a budget
+    that only grows as a fraction of successful requests, so an outage
+    produces a trickle of retries, not a storm.
+    
+    reserve() returns the delay before the caller may send, so the same
+    governor paces threads (time.sleep) and coroutines (asyncio.sleep).
+    """
+
+    def __init__(self, name: str, rate: float = 5.0, min_rate: float = 0.2, max_rate: float = 100.0,
+                 burst: float = None, increase: float = 1.0, decrease: float = 0.5,
+                 retry_ratio: float = 0.2, min_retry_budget: float = 10.0,
+                 base_backoff: float = 0.5, max_backoff: float = 60.0):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.retry_ratio = retry_ratio
+        self.min_retry_budget = min_retry_budget
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.requests = 0
+        self.throttles = 0
+        self.retries = 0
+        self.retries_denied = 0
+        
+        self._tokens = self._capacity()
+        self._retry_tokens = self._retry_capacity()
+        # Time the bucket was last refilled; set in the future while a Retry-After pause holds
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _capacity(self) -> float:
+        # By default allow about one second of requests in a burst, shrinking as the rate is cut
+        return self.burst if self.burst is not None else max(1.0, self.rate)
+
+    def _retry_capacity(self) -> float:
+        # Retries earned over about ten seconds at the current rate
+        return max(self.min_retry_budget, self.rate * self.retry_ratio * 10)
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self._capacity(), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self) -> float:
+        """Take a slot for one request and return how many seconds to wait before sending it"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            self.requests += 1
+            # A negative balance is a queue of earlier reservations still waiting for tokens,
+            # which only start refilling once any pause is over
+            return max(0.0, self._updated - now) + max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> None:
+        """Block the calling thread until it may send a request"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """Wait without blocking the event loop until a request may be sent"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            # Only successes earn retries, so a failing API cannot fund its own retry storm
+            self._retry_tokens = min(self._retry_tokens + self.retry_ratio, self._retry_capacity())
+
+    def on_throttle(self, retry_after: float = None) -> None:
+        """Slow down after a rate-limit error, honouring the server's Retry-After if it gave one"""
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            self._refill(now)
+            if now - self._last_decrease >= max(1.0 / self.rate, retry_after or 0.0):
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._tokens = min(self._tokens, 0.0)
+                self._last_decrease = now
+                print(f"{self.name}: throttled, pacing at {self.rate:.2f} requests/s")
+            if retry_after:
+                # Hold the refill clock until the pause ends, so no tokens pile up for a burst
+                self._tokens = min(self._tokens, 0.0)
+                self._updated = max(self._updated, now + retry_after)
+
+    def try_retry(self) -> bool:
+        """Spend one unit of the retry budget, or return False if it is exhausted"""
+        with self._lock:
+            if self._retry_tokens >= 1:
+                self._retry_tokens -= 1
+                self.retries += 1
+                return True
+            self.retries_denied += 1
+            return False
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        if retry_after:
+            # Spread the callers released by the same hint instead of waking them together
+            delay = retry_after + random.uniform(0, min(self.max_backoff, retry_after * 0.1 + self.base_backoff))
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "rate": round(self.rate, 2),
+                "requests": self.requests,
+                "throttles": self.throttles,
+                "retries": self.retries,
+                "retries_denied": self.retries_denied,
+            }
+
+
+# One governor per API quota, shared by every embedder, stage and worker thread in the process
+GEMINI_GOVERNOR = RateGovernor("Gemini embeddings",
+                               rate=float(os.getenv('GEMINI_INITIAL_RPS', 10)),
+                               max_rate=float(os.getenv('GEMINI_MAX_RPS', 100)))
+PINECONE_WRITE_GOVERNOR = RateGovernor("Pinecone upserts",
+                                       rate=float(os.getenv('PINECONE_INITIAL_WRITE_RPS', 10)),
+                                       max_rate=float(os.getenv('PINECONE_MAX_WRITE_RPS', 100)))
+PINECONE_READ_GOVERNOR = RateGovernor("Pinecone queries",
+                                      rate=float(os.getenv('PINECONE_INITIAL_READ_RPS', 20)),
+                                      max_rate=float(os.getenv('PINECONE_MAX_READ_RPS', 200)))
+
+
+def _call_with_retry(description: str, call: Callable[[], Any], governor: RateGovernor, max_retries: int = 5) -> Any:
+    """
+    Run call() paced by a governor, retrying retryable errors with jittered backoff
+    
+    Throttling errors slow the governor down and successes speed it up.
+    Retries stop at max_retries or when the governor's retry budget is
+    spent, and the last error is raised.
+    """
+    for attempt in range(max_retries):
+        governor.acquire()
+        try:
+            result = call()
+        except Exception as e:
+            print(f"{description} attempt {attempt + 1} failed: {e}")
+            retry_after = _retry_after(e)
+            if _is_throttled(e):
+                governor.on_throttle(retry_after)
+            if attempt == max_retries - 1 or not _is_retryable(e) or not governor.try_retry():
+                raise
+            wait_time = governor.backoff(attempt, retry_after)
+            print(f"Waiting {wait_time:.1f} seconds before retry...")
+            time.sleep(wait_time)
+        else:
+            governor.on_success()
+            return result
+
+
+class VectorUpsertStage:
+    """
+    Parallel upsert of vectors into one namespace, batched by serialised size
+    
+    Vectors are grouped until the next one would push the request past
+    max_batch_bytes or max_batch_vectors, and batches are sent on a bounded
+    thread pool paced by the shared Pinecone write governor. Transient errors
+    are retried with jittered backoff while the governor's retry budget
+    allows, and the batch fails once that runs out. A batch rejected as too
+    large or for its contents is split in half and each half retried, so
+    only the vectors that really cannot be stored are dropped. Auth and
+    not-found errors fail the batch and every batch after it.
+    """
+
+    # Pinecone rejects upsert requests over 2 MB or 1000 vectors
+    MAX_REQUEST_BYTES = 2 * 1024 * 1024
+    MAX_REQUEST_VECTORS = 1000
+
+    def __init__(self, index, namespace: str, sidecar: Optional[SidecarTextStore] = None,
+                 max_batch_bytes: int = int(MAX_REQUEST_BYTES * 0.9), max_batch_vectors: int = MAX_REQUEST_VECTORS,
+                 max_workers: int = 4, max_retries: int = 5, governor: RateGovernor = None):
+        self.index = index
+        self.namespace = namespace
+        self.sidecar = sidecar
+        self.governor = governor or PINECONE_WRITE_GOVERNOR
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_vectors = max_batch_vectors
+        self.max_retries = max_retries
+        self.succeeded = 0
+        self.failed = 0
+        self.first_id = None
+        
+        self._fatal_error: Optional[Exception] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._batch_payloads: Dict[str, Dict[str, Any]] = {}
+        self._batch_bytes = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Cap queued batches so a fast producer cannot buffer the whole book in memory
+        self._slots = threading.BoundedSemaphore(max_workers * 2)
+        self._futures = []
+
+    @staticmethod
+    def _vector_bytes(vector: Dict[str, Any]) -> int:
+        # Serialised size plus the separator it adds to the request body
+        return len(json.dumps(vector, separators=(',', ':'))) + 1
+
+    def add(self, vector: Dict[str, Any], sidecar_payload: Dict[str, Any] = None) -> None:
+        """Queue a vector, sending the current batch first if this one would not fit"""
+        size = self._vector_bytes(vector)
+        if self._batch and (self._batch_bytes + size > self.max_batch_bytes
+                            or len(self._batch) >= self.max_batch_vectors):
+            self.flush()
+        if self.first_id is None:
+            self.first_id = vector["id"]
+        self._batch.append(vector)
+        self._batch_bytes += size
+        if sidecar_payload is not None:
+            self._batch_payloads[vector["id"]] = sidecar_payload
+
+    def flush(self) -> None:
+        """Send the pending batch"""
+        if not self._batch:
+            return
+        batch, payloads = self._batch, self._batch_payloads
+        self._batch, self._batch_payloads, self._batch_bytes = [], {}, 0
+        
+        # Write payloads first so a vector is never visible without its text
+        if payloads:
+            self.sidecar.put_many(payloads)
+        
+        self._slots.acquire()
+        future = self._executor.submit(self._send, batch)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def close(self) -> Tuple[int, int]:
+        """Send anything pending, wait for all batches and return (succeeded, failed)"""
+        self.flush()
+        for future in self._futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error upserting batch: {e}")
+                traceback.print_exc()
+        self._executor.shutdown()
+        return self.succeeded, self.failed
+
+    def _fail(self, batch: List[Dict[str, Any]], error: Exception) -> None:
+        if len(batch) == 1:
+            print(f"Error upserting vector {batch[0]['id']}: {error}")
+        else:
+            print(f"Error upserting batch of {len(batch)} vectors: {error}")
+        with self._lock:
+            self.failed += len(batch)
+
+    def _send(self, batch: List[Dict[str, Any]]) -> None:
+        if self._fatal_error is not None:
+            self._fail(batch, self._fatal_error)
+            return
+        print(f"Upserting batch of {len(batch)} vectors to namespace {self.namespace}...")
+        error = None
+        for attempt in range(self.max_retries):
+            self.governor.acquire()
+            try:
+                self.index.upsert(vectors=batch, namespace=self.namespace)
+                self.governor.on_success()
+                with self._lock:
+                    self.succeeded += len(batch)
+                return
+            except Exception as e:
+                error = e
+                retry_after = _retry_after(e)
+                if _is_throttled(e):
+                    self.governor.on_throttle(retry_after)
+                if not _is_transient(e) or _is_payload_too_large(e):
+                    break
+                if attempt < self.max_retries - 1 and self.governor.try_retry():
+                    wait_time = self.governor.backoff(attempt, retry_after)
+                    print(f"Retry {attempt + 1}/{self.max_retries} in {wait_time:.1f}s due to error: {e}")
+                    time.sleep(wait_time)
+                else:
+                    break
+        
+        if _error_status(error) in (401, 403, 404):
+            # Wrong key or missing index: no later batch can succeed either
+            self._fatal_error = error
+        if len(batch) == 1 or not _is_vector_error(error):
+            self._fail(batch, error)
+            return
+        
+        # Split and retry each half, isolating whatever cannot be stored
+        print(f"Splitting batch of {len(batch)} vectors after error: {error}")
+        middle = len(batch) // 2
+        self._send(batch[:middle])
+        self._send(batch[middle:])
+
+
+class PdfExtractor(ABC):
+    """Base class for PDF text extraction engines"""
+    
+    name = ""
+
+    @abstractmethod
+    def extract_pages(self, pdf_path: str) -> List[str]:
+        """Return the text of every page, in page order"""
+
+class PyPDF2Extractor(PdfExtractor):
+    """Pure-Python extraction with PyPDF2; always available"""
+    
+    name = "pypdf2"
+
+    def extract_pages(self, pdf_path: str) -> List[str]:
+        reader = PdfReader(pdf_path)
+        return [page.extract_text() or "" for page in reader.pages]
+
+
+class PyMuPDFExtractor(PdfExtractor):
+    """Native extraction with PyMuPDF (MuPDF)"""
+    
+    name = "pymupdf"
+
+    def __init__(self):
+        try:
+            import pymupdf
+        except ImportError:
+            # Releases before 1.24 only ship the legacy module name
+            import fitz as pymupdf
+        self._pymupdf = pymupdf
+
+    def extract_pages(self, pdf_path: str) -> List[str]:
+        with self._pymupdf.open(pdf_path) as doc:
+            return [page.get_text() for page in doc]
+
+
+class PdfiumExtractor(PdfExtractor):
+    """Native extraction with pypdfium2 (PDFium)"""
+    
+    name = "pdfium"
+
+    def __init__(self):
+        import pypdfium2
+        self._pdfium = pypdfium2
+
+    def extract_pages(self, pdf_path: str) -> List[str]:
+        pdf = self._pdfium.PdfDocument(pdf_path)
+        try:
+            pages = []
+            for page in pdf:
+                text_page = page.get_textpage()
+                pages.append(text_page.get_text_range())
+                text_page.close()
+                page.close()
+            return pages
+        finally:
+            pdf.close()
+
+
+PDF_EXTRACTORS = {
+    PyPDF2Extractor.name: PyPDF2Extractor,
+    PyMuPDFExtractor.name: PyMuPDFExtractor,
+    PdfiumExtractor.name: PdfiumExtractor,
+}
+
+
+def get_pdf_extractor(engine: str = None) -> PdfExtractor:
+    """
+    Return the configured PDF extractor, falling back to PyPDF2
+    
+    The engine comes from the argument, then the PDF_ENGINE environment
+    variable, and defaults to "pypdf2". Engines whose library is not
+    installed fall back to PyPDF2 with a warning.
+    """
+    engine = (engine or os.getenv('PDF_ENGINE') or PyPDF2Extractor.name).lower()
+    if engine not in PDF_EXTRACTORS:
+        raise ValueError(f"Unknown PDF engine: {engine}. Choose from {', '.join(PDF_EXTRACTORS)}")
+    try:
+        return PDF_EXTRACTORS[engine]()
+    except ImportError as e:
+        print(f"Warning: PDF engine '{engine}' is not available ({e}). Falling back to PyPDF2.")
+        return PyPDF2Extractor()
+
+
+class PageCache:
+    """On-disk cache of extracted pages keyed by file content hash and engine"""
+
+    def __init__(self, cache_dir: str = '.page_cache'):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, content_hash: str, engine: str) -> str:
+        return os.path.join(self.cache_dir, f"{content_hash}.{engine}.json.z")
+
+    def get(self, content_hash: str, engine: str) -> Optional[List[Dict[str, Any]]]:
+        path = self._path(content_hash, engine)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return json.loads(zlib.decompress(f.read()))
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable page cache entry {path}: {e}")
+            return None
+
+    def put(self, content_hash: str, engine: str, pages: List[Dict[str, Any]]) -> None:
+        path = self._path(content_hash, engine)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(json.dumps(pages).encode('utf-8')))
+        os.replace(tmp_path, path)
+
+
+def benchmark_pdf_engines(pdf_path: str, engines: List[str] = None, repeat: int = 1) -> List[Dict[str, Any]]:
+    """
+    Compare PDF engines on extraction speed and output parity with PyPDF2
+    
+    Parity is the share of PyPDF2's words (as a multiset) that the engine
+    also produced, averaged over pages, so 1.0 means no words lost or changed.
+    Engines that are not installed are reported as unavailable.
+    """
+    if repeat < 1:
+        raise ValueError(f"repeat must be at least 1, got {repeat}")
+    engines = engines or list(PDF_EXTRACTORS)
+    baseline = [Counter(text.split()) for text in PyPDF2Extractor().extract_pages(pdf_path)]
+    
+    report = []
+    for engine in engines:
+        try:
+            extractor = PDF_EXTRACTORS[engine]()
+        except ImportError as e:
+            report.append({"engine": engine, "available": False, "error": str(e)})
+            continue
+        
+        start = time.perf_counter()
+        for _ in range(repeat):
+            pages = extractor.extract_pages(pdf_path)
+        elapsed = (time.perf_counter() - start) / repeat
+        
+        page_parity = []
+        for expected, text in zip(baseline, pages):
+            expected_words = sum(expected.values())
+            if expected_words:
+                page_parity.append(sum((expected & Counter(text.split())).values()) / expected_words)
+        
+        report.append({
+            "engine": engine,
+            "available": True,
+            "pages": len(pages),
+            "seconds": round(elapsed, 3),
+            "pages_per_second": round(len(pages) / elapsed, 1) if elapsed else None,
+            "page_count_matches": len(pages) == len(baseline),
+            "word_parity": round(sum(page_parity) / len(page_parity), 4) if page_parity else None
+        })
+    return report
+
+
+class DocxStreamParser:
+    """
+    Stream paragraphs out of a .docx with their styles and page breaks
+    
+    word/document.xml is read incrementally with iterparse and each paragraph
+    element is cleared once emitted, so memory stays flat however long the
+    document is. Only the small styles part is read whole, to map style IDs
+    to names.
+    """
+    
+    W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+    PAGE_BREAK = {"kind": "page_break"}
+    HEADING_STYLE = re.compile(r'^heading\s*(\d)$', re.IGNORECASE)
+
+    def __init__(self, docx_path: str):
+        self.docx_path = docx_path
+
+    def _style_names(self, archive: zipfile.ZipFile) -> Dict[str, str]:
+        """Map style IDs to style names (IDs are localised in some Word versions, names are not)"""
+        if 'word/styles.xml' not in archive.namelist():
+            return {}
+        names = {}
+        with archive.open('word/styles.xml') as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag == f'{self.W}style':
+                    name = elem.find(f'{self.W}name')
+                    style_id = elem.get(f'{self.W}styleId')
+                    if style_id and name is not None:
+                        names[style_id] = name.get(f'{self.W}val', style_id)
+                    elem.clear()
+        return names
+
+    def _classify(self, style: str, is_list: bool) -> Tuple[str, int]:
+        """Return (kind, level) for a paragraph style"""
+        heading = self.HEADING_STYLE.match(style)
+        if heading:
+            return "heading", int(heading.group(1))
+        if style.lower() == 'title':
+            return "title", 0
+        if is_list or style.lower().startswith('list'):
+            return "list", 0
+        return "body", 0
+
+    def iter_blocks(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield paragraphs and page-break markers in document order
+        
+        Paragraphs are dicts with text, style, kind ("heading", "title",
+        "list" or "body") and level; page breaks are PAGE_BREAK.
+        """
+        with zipfile.ZipFile(self.docx_path) as archive:
+            style_names = self._style_names(archive)
+            # Paragraphs can nest (text boxes inside a run), so keep one state per open paragraph
+            stack: List[Dict[str, Any]] = []
+            
+            def paragraph(state: Dict[str, Any]) -> Dict[str, Any]:
+                name = style_names.get(state["style"], state["style"])
+                kind, level = self._classify(name, state["is_list"])
+                return {"kind": kind, "level": level, "style": name, "text": ''.join(state["parts"]).strip()}
+            
+            with archive.open('word/document.xml') as f:
+                for event, elem in ET.iterparse(f, events=('start', 'end')):
+                    tag = elem.tag
+                    if event == 'start':
+                        if tag == f'{self.W}p':
+                            stack.append({"parts": [], "style": "", "is_list": False})
+                        continue
+                    if not stack:
+                        if tag == f'{self.W}tbl':
+                            elem.clear()
+                        continue
+                    
+                    state = stack[-1]
+                    if tag == f'{self.W}t':
+                        state["parts"].append(elem.text or '')
+                    elif tag == f'{self.W}tab':
+                        state["parts"].append('\t')
+                    elif tag in (f'{self.W}br', f'{self.W}cr'):
+                        if elem.get(f'{self.W}type') == 'page':
+                            # Emit text before the break on the page it belongs to
+                            block = paragraph(state)
+                            if block["text"]:
+                                yield block
+                            state["parts"] = []
+                            yield self.PAGE_BREAK
+                        elif elem.get(f'{self.W}type') != 'column':
+                            state["parts"].append('\n')
+                    elif tag == f'{self.W}lastRenderedPageBreak':
+                        # Same as a hard break: text rendered before it stays on the earlier page
+                        block = paragraph(state)
+                        if block["text"]:
+                            yield block
+                        state["parts"] = []
+                        yield self.PAGE_BREAK
+                    elif tag == f'{self.W}pStyle':
+                        state["style"] = elem.get(f'{self.W}val', '')
+                    elif tag == f'{self.W}numPr':
+                        state["is_list"] = True
+                    elif tag == f'{self.W}pageBreakBefore' and elem.get(f'{self.W}val', 'true') not in ('0', 'false'):
+                        yield self.PAGE_BREAK
+                    elif tag == f'{self.W}p':
+                        block = paragraph(stack.pop())
+                        if block["text"]:
+                            yield block
+                        elem.clear()
+
+    def parse(self) -> List[Dict[str, Any]]:
+        """Group the block stream into pages of styled paragraphs"""
+        pages = []
+        current: List[Dict[str, Any]] = []
+        
+        def close_page() -> None:
+            pages.append({
+                "page_num": len(pages) + 1,
+                "text": '\n\n'.join(block["text"] for block in current),
+                "paragraphs": current,
+                "metadata": {}
+            })
+        
+        for block in self.iter_blocks():
+            if block is self.PAGE_BREAK:
+                # Word often marks one break twice (hard break + rendered break); skip empty pages
+                if current:
+                    close_page()
+                    current = []
+            else:
+                current.append(block)
+        if current:
+            close_page()
+        return pages
+
+
 class DocumentParser:
     """Handle document parsing with format detection"""
     
     @staticmethod
-    def parse_document(file_path: str) -> List[Dict[str, Any]]:
-        """Parse document and return structured content"""
+    def parse_document(file_path: str, pdf_engine: str = None,
+                       page_cache_dir: Optional[str] = '.page_cache') -> List[Dict[str, Any]]:
+        """
+        Parse document and return structured content
+        
+        Args:
+            file_path: Path to a PDF or Word document
+            pdf_engine: PDF extraction engine name; see get_pdf_extractor
+            page_cache_dir: Directory for cached PDF pages, or None to disable caching
+        """
         if file_path.lower().endswith('.pdf'):
-            return DocumentParser._parse_pdf(file_path)
+            return DocumentParser._parse_pdf(file_path, pdf_engine, page_cache_dir)
         elif file_path.lower().endswith(('.docx', '.doc')):
             return DocumentParser._parse_word(file_path)
         else:
             raise ValueError(f"Unsupported file format: {file_path}")
     
     @staticmethod
-    def _parse_pdf(pdf_path: str) -> List[Dict[str, Any]]:
-        """Parse PDF and return structured content"""
+    def _parse_pdf(pdf_path: str, pdf_engine: str = None,
+                   page_cache_dir: Optional[str] = '.page_cache') -> List[Dict[str, Any]]:
+        """Parse PDF and return structured content, reusing cached pages for unchanged files"""
         try:
-            reader = PdfReader(pdf_path)
-            pages = []
-            
-            for page_num, page in enumerate(reader.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    pages.append({
-                        "page_num": page_num + 1,
-                        "text": page_text,
-                        "metadata": {}
-                    })
+            extractor = get_pdf_extractor(pdf_engine)
+            # A native engine that chokes on a particular file falls back to PyPDF2
+            extractors = [extractor]
+            if extractor.name != PyPDF2Extractor.name:
+                extractors.append(PyPDF2Extractor())
             
-            return pages
+            cache = PageCache(page_cache_dir) if page_cache_dir else None
+            content_hash = PageCache.file_hash(pdf_path) if cache else None
+            for candidate in extractors:
+                if cache:
+                    cached_pages = cache.get(content_hash, candidate.name)
+                    if cached_pages is not None:
+                        print(f"Using cached pages for {pdf_path} ({candidate.name})")
+                        return cached_pages
+                
+                try:
+                    pages = []
+                    for page_num, page_text in enumerate(candidate.extract_pages(pdf_path)):
+                        if page_text:
+                            pages.append({
+                                "page_num": page_num + 1,
+                                "text": page_text,
+                                "metadata": {}
+                            })
+                except Exception as e:
+                    if candidate is extractors[-1]:
+                        raise
+                    print(f"Warning: PDF engine '{candidate.name}' failed on {pdf_path} ({e}). Falling back to PyPDF2.")
+                    continue
+                
+                # Cache under the engine that actually produced the pages
+                if cache and pages:
+                    cache.put(content_hash, candidate.name, pages)
+                return pages
         except Exception as e:
             print(f"Error parsing PDF: {e}")
             traceback.print_exc()
@@ -122,7 +1292,24 @@ class DocumentParser:
     
     @staticmethod
     def _parse_word(docx_path: str) -> List[Dict[str, Any]]:
-        """Parse Word document and return structured content"""
+        """Parse Word document into pages of styled paragraphs"""
+        try:
+            pages = DocxStreamParser(docx_path).parse()
+            if not any(block["kind"] in ("heading", "title") for page in pages for block in page["paragraphs"]):
+                # No heading styles to go by: keep the plain-text pages the chapter heuristics were tuned on
+                return DocumentParser._parse_word_text(docx_path)
+            return pages
+        except zipfile.BadZipFile:
+            # Not an Office Open XML package (e.g. legacy .doc); use plain-text extraction
+            return DocumentParser._parse_word_text(docx_path)
+        except Exception as e:
+            print(f"Error parsing Word document: {e}")
+            traceback.print_exc()
+            return []
+    
+    @staticmethod
+    def _parse_word_text(docx_path: str) -> List[Dict[str, Any]]:
+        """Parse Word document as plain text, guessing page boundaries"""
         try:
             text = docx2txt.process(docx_path)
             # Rough page splitting based on form feeds or large gaps
@@ -147,6 +1334,13 @@ class DocumentParser:
 class TextProcessor:
     """Process text for smart chunking"""
     
+    CHAPTER_PATTERNS = [
+        r'(?:^|\n)(?:CHAPTER|Chapter)\s*#?\s*([0-9IVXLCDM]+)\s+(.+?)(?:\n|$)',  # Handles 'Chapter # 03 Circular Motion'
+        r'(?:^|\n)(?:CHAPTER|Chapter)\s+([0-9IVXLCDM]+)[.\s]+(.+?)(?:\n|$)',
+        r'(?:^|\n)(?:Unit|UNIT)\s+([0-9IVXLCDM]+)[.\s]+(.+?)(?:\n|$)',
+        r'(?:^|\n)([0-9IVXLCDM]+)[.\s]+(.+?)(?:\n|$)'
+    ]
+    
     @staticmethod
     def _is_mcq(text: str) -> Tuple[bool, Dict[str, Any]]:
         """Detect if text is an MCQ and extract its components"""
@@ -179,10 +1373,8 @@ class TextProcessor:
         return False, None
 
     @staticmethod
-    def extract_structure(pages: List[Dict[str, Any]]) -> Tuple[List[TextChunk], Dict[str, Any]]:
-        """Extract document structure and chunks"""
-        all_chunks = []
-        book_structure = {
+    def _new_book_structure(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
             "title": "",
             "chapters": [],
             "sections": defaultdict(list),
@@ -192,15 +1384,23 @@ class TextProcessor:
                 "extracted_at": time.time()
             }
         }
+
+    @staticmethod
+    def extract_structure(pages: List[Dict[str, Any]]) -> Tuple[List[TextChunk], Dict[str, Any]]:
+        """Extract document structure and chunks"""
+        # Parsers that know the real paragraph styles let us skip the heuristics, but only
+        # when the document uses heading styles; chapters typed in Normal style still need them
+        if pages and all("paragraphs" in page for page in pages) and any(
+            block["kind"] in ("heading", "title") for page in pages for block in page["paragraphs"]
+        ):
+            return TextProcessor._extract_styled_structure(pages)
+        
+        all_chunks = []
+        book_structure = TextProcessor._new_book_structure(pages)
         
         # First pass - detect structure
         current_chapter = None
-        chapter_patterns = [
-            r'(?:^|\n)(?:CHAPTER|Chapter)\s*#?\s*([0-9IVXLCDM]+)\s+(.+?)(?:\n|$)',  # Handles 'Chapter # 03 Circular Motion'
-            r'(?:^|\n)(?:CHAPTER|Chapter)\s+([0-9IVXLCDM]+)[.\s]+(.+?)(?:\n|$)',
-            r'(?:^|\n)(?:Unit|UNIT)\s+([0-9IVXLCDM]+)[.\s]+(.+?)(?:\n|$)',
-            r'(?:^|\n)([0-9IVXLCDM]+)[.\s]+(.+?)(?:\n|$)'
-        ]
+        chapter_patterns = TextProcessor.CHAPTER_PATTERNS
         
         for page_data in pages:
             page_num = page_data["page_num"]
@@ -288,31 +1488,117 @@ class TextProcessor:
                     continue
                 
                 # Process regular paragraph
-                if len(para) > 1000:
-                    semantic_chunks = TextProcessor._split_into_semantic_chunks(para)
-                    for i, chunk_text in enumerate(semantic_chunks):
-                        chunk = TextChunk(
-                            text=chunk_text,
-                            page_num=page_num,
-                            section=current_section,
-                            position=chunk_position,
-                            chapter=current_chapter,
-                            subsection=f"Part {i+1}/{len(semantic_chunks)}"
-                        )
-                        all_chunks.append(chunk)
-                        chunk_position += 1
-                else:
-                    chunk = TextChunk(
-                        text=para,
-                        page_num=page_num,
-                        section=current_section,
-                        position=chunk_position,
-                        chapter=current_chapter
-                    )
-                    all_chunks.append(chunk)
+                paragraph_chunks = TextProcessor._paragraph_chunks(
+                    para, page_num, current_section, current_chapter, chunk_position
+                )
+                all_chunks.extend(paragraph_chunks)
+                chunk_position += len(paragraph_chunks)
+        
+        return all_chunks, dict(book_structure)
+
+    @staticmethod
+    def _extract_styled_structure(pages: List[Dict[str, Any]]) -> Tuple[List[TextChunk], Dict[str, Any]]:
+        """
+        Extract structure and chunks in one pass from paragraphs with known styles
+        
+        Heading 1 starts a chapter, deeper headings start sections, and a
+        Title paragraph names the book; no regex guessing is needed.
+        """
+        all_chunks = []
+        book_structure = TextProcessor._new_book_structure(pages)
+        current_chapter = None
+        current_section = None
+        chunk_position = 0
+        
+        for page_data in pages:
+            page_num = page_data["page_num"]
+            
+            for block in page_data["paragraphs"]:
+                para = block["text"]
+                kind = block["kind"]
+                
+                if kind in ("title", "heading"):
+                    if kind == "title":
+                        book_structure["title"] = book_structure["title"] or para
+                    elif block["level"] == 1:
+                        chapter_info = TextProcessor._chapter_info(
+                            para, len(book_structure["chapters"]) + 1, page_num
+                        )
+                        book_structure["chapters"].append(chapter_info)
+                        current_chapter = chapter_info["full_title"]
+                        current_section = None
+                    else:
+                        current_section = para
+                        book_structure["sections"][current_chapter].append(current_section)
+                    
+                    all_chunks.append(TextChunk(
+                        text=para,
+                        page_num=page_num,
+                        section=para,
+                        position=chunk_position,
+                        chunk_type="heading",
+                        chapter=current_chapter,
+                        importance_score=0.9
+                    ))
+                    chunk_position += 1
+                    continue
+                
+                is_mcq, mcq_data = TextProcessor._is_mcq(para)
+                if is_mcq:
+                    all_chunks.append(TextChunk(
+                        text=para,
+                        page_num=page_num,
+                        section=current_section,
+                        position=chunk_position,
+                        chunk_type="mcq",
+                        chapter=current_chapter,
+                        mcq_data=mcq_data
+                    ))
                     chunk_position += 1
+                    book_structure["mcq_sections"][current_chapter].append(mcq_data)
+                    continue
+                
+                paragraph_chunks = TextProcessor._paragraph_chunks(
+                    para, page_num, current_section, current_chapter, chunk_position
+                )
+                all_chunks.extend(paragraph_chunks)
+                chunk_position += len(paragraph_chunks)
         
         return all_chunks, dict(book_structure)
+
+    @staticmethod
+    def _chapter_info(heading: str, ordinal: int, page_num: int) -> Dict[str, Any]:
+        """Build chapter info from a Heading 1 paragraph, kept as written and numbered by position"""
+        return {
+            "number": str(ordinal),
+            "title": heading,
+            "page": page_num,
+            "full_title": heading
+        }
+
+    @staticmethod
+    def _paragraph_chunks(para: str, page_num: int, section: str, chapter: str, position: int) -> List[TextChunk]:
+        """Chunk a regular paragraph, splitting long ones at sentence boundaries"""
+        if len(para) > 1000:
+            semantic_chunks = TextProcessor._split_into_semantic_chunks(para)
+            return [
+                TextChunk(
+                    text=chunk_text,
+                    page_num=page_num,
+                    section=section,
+                    position=position + i,
+                    chapter=chapter,
+                    subsection=f"Part {i+1}/{len(semantic_chunks)}"
+                )
+                for i, chunk_text in enumerate(semantic_chunks)
+            ]
+        return [TextChunk(
+            text=para,
+            page_num=page_num,
+            section=section,
+            position=position,
+            chapter=chapter
+        )]
     
     @staticmethod
     def _split_into_paragraphs(text: str) -> List[str]:
@@ -387,14 +1673,328 @@ class TextProcessor:
                  re.match(r'^[A-Z][a-z]+( [A-Z][a-z]+){0,5}$', text)))
 
 
+class SemanticQueryCache:
+    """
+    Search-result cache keyed by query-embedding similarity
+    
+    Results are stored per partition (index, book, chapter and search
+    options) next to the normalised query embedding. A lookup scans the
+    partition's embedding matrix and returns the cached results of the
+    closest query if it is within max_distance in cosine distance, so
+    paraphrases like "what's displacement?" and "define displacement" share
+    one search. Entries expire after ttl seconds and the least recently used
+    are evicted beyond max_entries. Each entry records the generation of the
+    data it was built from (the routing table's last update for the book),
+    so entries are dropped once another process re-ingests or imports the
+    book; invalidate() does the same for changes made in this process.
+    """
+
+    def __init__(self, max_distance: float = 0.05, ttl: float = 3600.0, max_entries: int = 1024):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # partition -> (entry ids, embedding matrix); rebuilt lazily after changes
+        self._partitions: Dict[Tuple, List[int]] = defaultdict(list)
+        self._matrices: Dict[Tuple, np.ndarray] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def partition(index_name: str, book_id: str = None, chapter: str = None, **options: Any) -> Tuple:
+        """Key under which queries can share results: same index, filters and search options"""
+        return (index_name, book_id, chapter) + tuple(sorted(options.items()))
+
+    @staticmethod
+    def _normalise(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        partition = entry["partition"]
+        self._partitions[partition].remove(entry_id)
+        self._matrices.pop(partition, None)
+        if not self._partitions[partition]:
+            del self._partitions[partition]
+
+    def _matrix(self, partition: Tuple) -> np.ndarray:
+        matrix = self._matrices.get(partition)
+        if matrix is None:
+            matrix = np.stack([self._entries[entry_id]["embedding"] for entry_id in self._partitions[partition]])
+            self._matrices[partition] = matrix
+        return matrix
+
+    def lookup(self, partition: Tuple, embedding: List[float],
+               generation: float = 0.0) -> Optional[List[Dict[str, Any]]]:
+        """Return a copy of the cached results for the nearest similar query, or None
+        
+        Entries stored for an older generation of the data are dropped.
+        """
+        query = self._normalise(embedding)
+        with self._lock:
+            now = time.time()
+            # Drop expired and outdated entries in this partition before matching
+            for entry_id in list(self._partitions.get(partition, [])):
+                entry = self._entries[entry_id]
+                if now - entry["created_at"] > self.ttl:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                elif entry["generation"] < generation:
+                    self._remove(entry_id)
+                    self.invalidations += 1
+            
+            if partition not in self._partitions:
+                self.misses += 1
+                return None
+            
+            similarities = self._matrix(partition) @ query
+            best = int(np.argmax(similarities))
+            if 1.0 - float(similarities[best]) > self.max_distance:
+                self.misses += 1
+                return None
+            
+            entry_id = self._partitions[partition][best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return [dict(result) for result in self._entries[entry_id]["results"]]
+
+    def store(self, partition: Tuple, embedding: List[float], results: List[Dict[str, Any]],
+              generation: float = 0.0) -> None:
+        """Cache results, tagged with the data generation read before the search ran"""
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "partition": partition,
+                "embedding": self._normalise(embedding),
+                "results": [dict(result) for result in results],
+                "generation": generation,
+                "created_at": time.time()
+            }
+            self._partitions[partition].append(entry_id)
+            self._matrices.pop(partition, None)
+            
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, book_id: str = None, index_name: str = None) -> int:
+        """
+        Drop cached results that may include a book, or everything if book_id is None
+        
+        Searches without a book filter can return any book, so they are
+        dropped along with the book's own entries. With index_name, only
+        that index's entries are considered.
+        """
+        with self._lock:
+            stale = [
+                entry_id for entry_id, entry in self._entries.items()
+                if (index_name is None or entry["partition"][0] == index_name)
+                and (book_id is None or entry["partition"][1] in (book_id, None))
+            ]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+
+class NamespaceRouter:
+    """
+    Persistent routing table from (book_id, chapter) to an index namespace
+    
+    Each book chapter gets its own namespace, named from the book and chapter
+    plus a hash of the pair so that two books with the same chapter titles
+    never share one. Names keep the chapter_ prefix of the old title-derived
+    layout, which the web app uses to discover chapter namespaces. Vector
+    and MCQ counts per route let the query planner skip namespaces that
+    cannot match. Routes live in a SQLite file shared by ingestion and
+    search processes.
+    """
+
+    def __init__(self, index_name: str, db_path: str = 'routes.db'):
+        self.index_name = index_name
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS routes (
+                    index_name TEXT NOT NULL,
+                    book_id TEXT NOT NULL,
+                    chapter TEXT NOT NULL,
+                    namespace TEXT NOT NULL,
+                    vector_count INTEGER NOT NULL DEFAULT 0,
+                    mcq_count INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (index_name, book_id, chapter)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS routes_by_namespace ON routes (index_name, namespace)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _slug(value: str, max_length: int) -> str:
+        slug = re.sub(r'[^a-z0-9]+', '_', value.lower()).strip('_')
+        return slug[:max_length].rstrip('_')
+
+    @classmethod
+    def make_namespace(cls, book_id: str, chapter: str) -> str:
+        """Readable namespace for a route; the hash of the full pair keeps it unique"""
+        digest = hashlib.sha1(f"{book_id}\0{chapter}".encode()).hexdigest()[:10]
+        return f"chapter_{cls._slug(book_id, 24)}__{cls._slug(chapter, 24)}__{digest}"
+
+    def namespace_for(self, book_id: str, chapter: str) -> str:
+        """Return the route's namespace, creating the route on first use"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT namespace FROM routes WHERE index_name = ? AND book_id = ? AND chapter = ?",
+                (self.index_name, book_id, chapter)
+            ).fetchone()
+            if row:
+                return row["namespace"]
+            namespace = self.make_namespace(book_id, chapter)
+            conn.execute(
+                "INSERT OR IGNORE INTO routes (index_name, book_id, chapter, namespace, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (self.index_name, book_id, chapter, namespace, time.time())
+            )
+        return namespace
+
+    def assign(self, book_id: str, chapter: str, namespace: str, vector_count: int = 0, mcq_count: int = 0) -> None:
+        """Point a route at an explicit namespace, e.g. one chosen for an archive import"""
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO routes (index_name, book_id, chapter, namespace, vector_count, mcq_count, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (index_name, book_id, chapter) DO UPDATE SET
+                    namespace = excluded.namespace, vector_count = excluded.vector_count,
+                    mcq_count = excluded.mcq_count, updated_at = excluded.updated_at
+            """, (self.index_name, book_id, chapter, namespace, vector_count, mcq_count, time.time()))
+
+    def record_counts(self, book_id: str, chapter: str, vector_count: int, mcq_count: int) -> None:
+        """Store the number of vectors (and MCQ vectors) a route holds after ingestion"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE routes SET vector_count = ?, mcq_count = ?, updated_at = ? "
+                "WHERE index_name = ? AND book_id = ? AND chapter = ?",
+                (vector_count, mcq_count, time.time(), self.index_name, book_id, chapter)
+            )
+
+    def plan(self, book_id: str = None, chapter: str = None, chunk_type: str = None) -> Optional[List[str]]:
+        """
+        Namespaces that can hold matches for the given filters, smallest first
+        
+        Returns None when the book (or, without a book, the whole index) has
+        no routes because it was written before routing existed, so callers
+        can fall back to the old layout.
+        """
+        count_column = "mcq_count" if chunk_type == "mcq" else "vector_count"
+        conditions = ["index_name = ?", f"{count_column} > 0"]
+        params: List[Any] = [self.index_name]
+        if book_id:
+            conditions.append("book_id = ?")
+            params.append(book_id)
+        if chapter:
+            conditions.append("chapter = ?")
+            params.append(chapter)
+        
+        with self._connect() as conn:
+            routed = conn.execute(
+                "SELECT 1 FROM routes WHERE index_name = ? AND (? IS NULL OR book_id = ?) LIMIT 1",
+                (self.index_name, book_id, book_id)
+            ).fetchone()
+            if routed is None:
+                return None
+            rows = conn.execute(
+                f"SELECT namespace, SUM({count_column}) AS total FROM routes WHERE {' AND '.join(conditions)} "
+                "GROUP BY namespace ORDER BY total",
+                params
+            ).fetchall()
+        return [row["namespace"] for row in rows]
+
+    def generation(self, book_id: str = None) -> float:
+        """Time of the last route change for a book (or the whole index), 0.0 if it has none"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MAX(updated_at) AS generation FROM routes WHERE index_name = ? AND (? IS NULL OR book_id = ?)",
+                (self.index_name, book_id, book_id)
+            ).fetchone()
+        return row["generation"] or 0.0
+
+    def routes(self, book_id: str = None) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            if book_id:
+                rows = conn.execute("SELECT * FROM routes WHERE index_name = ? AND book_id = ? ORDER BY chapter",
+                                    (self.index_name, book_id))
+            else:
+                rows = conn.execute("SELECT * FROM routes WHERE index_name = ? ORDER BY book_id, chapter",
+                                    (self.index_name,))
+            return [dict(row) for row in rows.fetchall()]
+
+    def namespace_counts(self) -> Dict[str, int]:
+        """Vector count per namespace, as recorded at ingestion"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT namespace, SUM(vector_count) AS total FROM routes WHERE index_name = ? GROUP BY namespace",
+                (self.index_name,)
+            ).fetchall()
+        return {row["namespace"]: row["total"] for row in rows}
+
+
 class EnhancedBookEmbedder:
     """Enhanced Book Embedding with semantic chunking and structure awareness"""
     
-    def __init__(self, index_name='enhanced-book-embeddings', namespace='default'):
+    # Metadata kept in the index when slim_metadata is on; everything else is
+    # written to the sidecar store and hydrated at query time
+    SLIM_METADATA_FIELDS = ("book_id", "chunk_type", "chapter_id", "position", "chunk_id")
+
+    def __init__(self, index_name='enhanced-book-embeddings', namespace='default',
+                 slim_metadata: bool = False, sidecar_dir: str = 'sidecar',
+                 pdf_engine: str = None, page_cache_dir: Optional[str] = '.page_cache',
+                 semantic_cache: Optional[SemanticQueryCache] = None, routing_db: str = 'routes.db'):
         """Initialize Pinecone index for book embeddings"""
         self.index_name = index_name
         self.namespace = namespace
         self.book_metadata = {}
+        self.slim_metadata = slim_metadata
+        self.pdf_engine = pdf_engine
+        self.page_cache_dir = page_cache_dir
+        self.semantic_cache = semantic_cache
+        self.router = NamespaceRouter(index_name, routing_db)
+
+        # Open the sidecar when writing slim vectors, or when one already exists
+        # for this index so that searches can hydrate slim results
+        sidecar_path = os.path.join(sidecar_dir, index_name)
+        if slim_metadata or SidecarTextStore.exists(sidecar_path):
+            self.sidecar = SidecarTextStore(sidecar_path)
+        else:
+            self.sidecar = None
         
         try:
             # Wait for any previous operations to complete
@@ -431,7 +2031,8 @@ class EnhancedBookEmbedder:
             traceback.print_exc()
             raise
 
-    def _get_chapter_namespace(self, chapter: str) -> str:
+    @staticmethod
+    def _get_chapter_namespace(chapter: str) -> str:
         """Generate a namespace for a chapter"""
         if not chapter:
             return 'default'
@@ -445,8 +2046,71 @@ class EnhancedBookEmbedder:
             clean_chapter = clean_chapter[:50]
         return f"chapter_{clean_chapter}"
 
-    def process_document(self, file_path: str, book_id: str = None) -> str:
-        """Process document and store embeddings with enhanced chunking"""
+    @staticmethod
+    def _chapter_id(chapter: str) -> str:
+        """Short stable identifier for a chapter, used as a filterable field"""
+        if not chapter:
+            return ""
+        return hashlib.md5(chapter.encode()).hexdigest()[:8]
+
+    def _index_metadata(self, vector_id: str, metadata: Dict[str, Any],
+                        sidecar_records: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the metadata to store in the index for a vector
+        
+        In slim mode only the filterable fields are kept and the rest of the
+        payload is queued in sidecar_records for the sidecar store.
+        """
+        if not self.slim_metadata:
+            return metadata
+        
+        index_metadata = {
+            "book_id": metadata.get("book_id", ""),
+            "chunk_type": metadata.get("chunk_type", "text"),
+            "chapter_id": metadata.get("chapter_id") or self._chapter_id(metadata.get("chapter")),
+            "position": metadata.get("position", 0),
+            "chunk_id": metadata.get("chunk_id", 0)
+        }
+        sidecar_records[vector_id] = {
+            key: value for key, value in metadata.items() if key not in self.SLIM_METADATA_FIELDS
+        }
+        return index_metadata
+
+    def _hydrate_matches(self, matches) -> List[Dict[str, Any]]:
+        """Return match metadata, filling slim vectors in bulk from the sidecar store"""
+        return self._hydrate(matches, self.sidecar)
+
+    @staticmethod
+    def _hydrate(matches, sidecar: Optional[SidecarTextStore]) -> List[Dict[str, Any]]:
+        """Return match metadata, filling slim vectors in bulk from the given sidecar store"""
+        metadata_list = [dict(match.get('metadata') or {}) for match in matches]
+        if sidecar is None:
+            return metadata_list
+
+        missing_ids = [match['id'] for match, metadata in zip(matches, metadata_list) if 'text' not in metadata]
+        if not missing_ids:
+            return metadata_list
+
+        payloads = sidecar.get_many(missing_ids)
+        for match, metadata in zip(matches, metadata_list):
+            if 'text' not in metadata:
+                metadata.update(payloads.get(match['id'], {}))
+                metadata.setdefault('text', '')
+        return metadata_list
+
+    def process_document(self, file_path: str, book_id: str = None,
+                         progress_callback: Callable[[int, int], None] = None) -> str:
+        """
+        Process document and store embeddings with enhanced chunking
+        
+        Args:
+            file_path: Path to the PDF or Word document
+            book_id: Optional book ID; derived from the file name if omitted
+            progress_callback: Optional callable receiving (chunks_processed, total_chunks)
+            
+        Returns:
+            The book ID, or None if no content could be extracted
+        """
         # Generate a unique ID for this book if not provided
         if not book_id:
             book_id = os.path.basename(file_path).split('.')[0]
@@ -456,7 +2120,7 @@ class EnhancedBookEmbedder:
         print(f"Processing document: {file_path} (ID: {book_id})")
         
         # Parse document into pages
-        pages = DocumentParser.parse_document(file_path)
+        pages = DocumentParser.parse_document(file_path, self.pdf_engine, self.page_cache_dir)
         if not pages:
             print("No valid content found. Aborting processing.")
             return None
@@ -476,34 +2140,44 @@ class EnhancedBookEmbedder:
             json.dump(book_structure, f, indent=2)
         print(f"Saved book metadata to {metadata_path}")
         
-        # Group chunks by chapter
-        chapter_chunks = defaultdict(list)
-        for chunk in chunks:
-            chapter = chunk.chapter or 'default'
-            chapter_chunks[chapter].append(chunk)
+        # Group chunks by chapter into columnar batches; this empties the chunk list
+        total_chunks = len(chunks)
+        chapter_batches = ChunkBatch.group_by_chapter(chunks)
         
         print("\nDetected chapters:")
-        for chapter in chapter_chunks.keys():
+        for chapter in chapter_batches.keys():
             print(f"- {chapter}")
         
         # Process each chapter separately
         total_successful = 0
         total_failed = 0
+        chunks_done = 0
         
-        for chapter, chapter_chunk_list in chapter_chunks.items():
+        for chapter, chapter_batch in chapter_batches.items():
             print(f"\nProcessing chapter: {chapter}")
-            print(f"Number of chunks in chapter: {len(chapter_chunk_list)}")
+            print(f"Number of chunks in chapter: {len(chapter_batch)}")
             
-            # Create chapter namespace
-            chapter_namespace = self._get_chapter_namespace(chapter)
+            # Route the chapter to its own namespace
+            chapter_namespace = self.router.namespace_for(book_id, chapter)
             print(f"Using namespace: {chapter_namespace}")
             
+            chapter_progress = None
+            if progress_callback:
+                chapter_progress = lambda done, offset=chunks_done: progress_callback(offset + done, total_chunks)
+            
             # Process chunks for this chapter
             successful, failed = self._vectorize_and_store_chunks(
-                chapter_chunk_list, 
+                chapter_batch, 
                 book_id,
-                namespace=chapter_namespace
+                namespace=chapter_namespace,
+                progress_callback=chapter_progress
             )
+            chunks_done += len(chapter_batch)
+            
+            mcq_count = sum(1 for chunk_type in chapter_batch.chunk_types if chunk_type == "mcq")
+            self.router.record_counts(book_id, chapter, successful, min(mcq_count, successful))
+            # The chapter is stored; let its texts go
+            chapter_batches[chapter] = None
             
             total_successful += successful
             total_failed += failed
@@ -512,6 +2186,10 @@ class EnhancedBookEmbedder:
             print(f"Successfully processed: {successful} chunks")
             print(f"Failed chunks: {failed}")
         
+        # Cached searches may now be missing or pointing at replaced chunks
+        if self.semantic_cache is not None:
+            self.semantic_cache.invalidate(book_id, self.index_name)
+        
         print("\nOverall Processing Complete:")
         print(f"Total successfully processed: {total_successful} chunks")
         print(f"Total failed chunks: {total_failed}")
@@ -525,21 +2203,20 @@ class EnhancedBookEmbedder:
         
         return book_id
 
-    def _vectorize_and_store_chunks(self, chunks: List[TextChunk], book_id: str, namespace: str = 'default') -> Tuple[int, int]:
-        """Generate embeddings and store chunks in batches"""
-        total_vectors = []
-        successful_insertions = 0
+    def _vectorize_and_store_chunks(self, batch: ChunkBatch, book_id: str, namespace: str = 'default',
+                                    progress_callback: Callable[[int], None] = None) -> Tuple[int, int]:
+        """Generate embeddings and store a batch of chunks through a size-aware upsert stage"""
+        upsert_stage = VectorUpsertStage(self.index, namespace, sidecar=self.sidecar)
         failed_chunks = 0
-        batch_size = 100  # Increased from 50 to 100 for better throughput
         
-        total_chunks = len(chunks)
+        total_chunks = len(batch)
         print(f"Beginning vectorization of {total_chunks} chunks...")
         
         # Progress tracking
         last_progress_update = time.time()
         progress_interval = 1  # Update progress every second
         
-        for i, chunk in enumerate(chunks):
+        for i, text in enumerate(batch.texts):
             current_time = time.time()
             
             # Update progress less frequently to reduce console spam
@@ -549,106 +2226,61 @@ class EnhancedBookEmbedder:
                 last_progress_update = current_time
             
             # Generate embedding
-            embedding = self._generate_embedding_with_retry(chunk.text)
+            embedding = self._generate_embedding_with_retry(text)
             
             if embedding is not None:
                 # Create a unique chunk ID
-                chunk_hash = hashlib.md5(chunk.text.encode()).hexdigest()[:12]
+                chunk_hash = hashlib.md5(text.encode()).hexdigest()[:12]
                 chunk_id = f"{book_id}_chunk_{i}_{chunk_hash}"
                 
-                # Get chunk data and clean any None/null values
-                chunk_data = chunk.to_dict()
-                cleaned_metadata = {}
-                for key, value in chunk_data.items():
-                    if value is not None:
-                        cleaned_metadata[key] = value
-                    else:
-                        cleaned_metadata[key] = ""
-                        
+                metadata = batch.metadata(i, book_id=book_id, chunk_id=i, timestamp=time.time())
+
+                sidecar_records = {}
                 vector = {
                     "id": chunk_id,
                     "values": embedding,
-                    "metadata": {
-                        **cleaned_metadata,
-                        "book_id": book_id,
-                        "chunk_id": i,
-                        "timestamp": time.time()
-                    }
+                    "metadata": self._index_metadata(chunk_id, metadata, sidecar_records)
                 }
-                total_vectors.append(vector)
-                
-                # Batch upload when reaching batch size or at the end
-                if len(total_vectors) >= batch_size or i == len(chunks) - 1:
-                    try:
-                        print(f"Upserting batch of {len(total_vectors)} vectors to namespace {namespace}...")
-                        batch_ids = [v['id'] for v in total_vectors]
-                        
-                        # Upsert vectors with retry mechanism
-                        max_retries = 3
-                        for retry in range(max_retries):
-                            try:
-                                self.index.upsert(
-                                    vectors=total_vectors,
-                                    namespace=namespace
-                                )
-                                break
-                            except Exception as e:
-                                if retry == max_retries - 1:
-                                    raise
-                                print(f"Retry {retry + 1}/{max_retries} due to error: {e}")
-                                time.sleep(2 ** retry)  # Exponential backoff
-                        
-                        # Wait for consistency
-                        time.sleep(1)  # Reduced from 2 to 1 second
-                        
-                        # Verify insertion (only check first vector to save time)
-                        if self._verify_vector_insertion([batch_ids[0]], namespace):
-                            successful_insertions += len(total_vectors)
-                            print(f"Successfully verified insertion of batch {i//batch_size + 1}")
-                        else:
-                            print("Warning: Could not verify vector insertion")
-                            
-                        total_vectors = []  # Clear batch
-                        
-                    except Exception as e:
-                        print(f"Error upserting batch: {e}")
-                        failed_chunks += len(total_vectors)
-                        total_vectors = []  # Clear failed batch
-                        traceback.print_exc()
+                upsert_stage.add(vector, sidecar_records.get(chunk_id))
             else:
                 failed_chunks += 1
             
-            # Add a small delay every 1000 chunks to prevent rate limiting
-            if (i + 1) % 1000 == 0:
-                time.sleep(1)
+            if progress_callback:
+                progress_callback(i + 1)
+        
+        successful_insertions, failed_upserts = upsert_stage.close()
         
-        return successful_insertions, failed_chunks
+        # Spot-check one vector rather than pausing after every batch
+        if upsert_stage.first_id and successful_insertions:
+            if self._verify_vector_insertion([upsert_stage.first_id], namespace):
+                print(f"Successfully verified insertion into namespace {namespace}")
+            else:
+                print("Warning: Could not verify vector insertion")
+        
+        return successful_insertions, failed_chunks + failed_upserts
 
-    def _generate_embedding_with_retry(self, text: str, max_retries: int = 3) -> Optional[List[float]]:
-        """Generate embedding with retry mechanism"""
-        for attempt in range(max_retries):
-            try:
-                result = genai.embed_content(
-                    model="models/embedding-001",
-                    content=text,
-                )
-                return result['embedding']
-            except Exception as e:
-                print(f"Embedding attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    print(f"Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
-                else:
-                    print("Failed to generate embedding after all retries")
-                    return None
+    def _generate_embedding_with_retry(self, text: str, max_retries: int = 8) -> Optional[List[float]]:
+        """Generate embedding with retry mechanism, paced by the shared Gemini governor"""
+        try:
+            result = _call_with_retry(
+                "Embedding",
+                lambda: genai.embed_content(model="models/embedding-001", content=text),
+                GEMINI_GOVERNOR,
+                max_retries
+            )
+            return result['embedding']
+        except Exception:
+            print("Failed to generate embedding after all retries")
+            return None
     
     def _verify_vector_insertion(self, batch_ids: List[str], namespace: str = 'default') -> bool:
         """Verify that vectors were properly inserted"""
         try:
             # Fetch a sample vector to verify insertion
             sample_id = batch_ids[0]
-            fetch_response = self.index.fetch(ids=[sample_id], namespace=namespace)
+            fetch_response = _call_with_retry(
+                "Fetch", lambda: self.index.fetch(ids=[sample_id], namespace=namespace), PINECONE_READ_GOVERNOR
+            )
             return sample_id in fetch_response['vectors']
         except Exception as e:
             print(f"Error verifying vector insertion: {e}")
@@ -676,18 +2308,28 @@ class EnhancedBookEmbedder:
             if query_embedding is None:
                 return []
             
+            # Serve paraphrases of recent queries from the semantic cache
+            cache_partition = SemanticQueryCache.partition(
+                self.index_name, book_id, chapter,
+                top_k=top_k, include_context=include_context, similarity_cutoff=similarity_cutoff
+            )
+            if self.semantic_cache is not None:
+                # Re-ingestion in any process moves the generation on
+                generation = self.router.generation(book_id)
+                cached_results = self.semantic_cache.lookup(cache_partition, query_embedding, generation)
+                if cached_results is not None:
+                    return cached_results
+            
             # Set up search filters
             filter_obj = {"book_id": {"$eq": book_id}} if book_id else None
             
-            # Determine namespace based on chapter
-            namespace = self._get_chapter_namespace(chapter) if chapter else None
-            
-            # Perform search
-            search_results = self.index.query(
+            # Query only the namespaces that can hold matches
+            namespaces = self._plan_namespaces(book_id, chapter)
+            scored = self._query_namespaces(
+                namespaces,
                 vector=query_embedding,
                 top_k=top_k if not include_context else top_k * 2,  # Get more results if including context
                 include_metadata=True,
-                namespace=namespace,
                 filter=filter_obj
             )
             
@@ -695,36 +2337,28 @@ class EnhancedBookEmbedder:
             results = []
             seen_chunk_ids = set()
             
-            for match in search_results['matches']:
-                if match['score'] < similarity_cutoff:
-                    continue
-                    
-                chunk_result = {
-                    'text': match['metadata']['text'],
-                    'score': match['score'],
-                    'page': match['metadata'].get('page_num', 0),
-                    'chapter': match['metadata'].get('chapter', ''),
-                    'section': match['metadata'].get('section', ''),
-                }
+            scored = [(namespace, match) for namespace, match in scored if match['score'] >= similarity_cutoff]
+            matches = [match for _, match in scored]
+            
+            for (namespace, match), metadata in zip(scored, self._hydrate_matches(matches)):
+                chunk_result = self._match_result(match, metadata)
                 
-                chunk_id = match['metadata'].get('chunk_id')
-                book_id = match['metadata'].get('book_id')
-                seen_chunk_ids.add(chunk_id)
+                chunk_id = metadata.get('chunk_id')
+                match_book_id = metadata.get('book_id')
+                # Chunk IDs restart in every namespace, so track them per namespace
+                seen_chunk_ids.add((namespace, chunk_id))
                 
                 # Add this result
                 results.append(chunk_result)
                 
                 # Add contextual chunks if requested
-                if include_context and chunk_id is not None and book_id is not None:
-                    context_chunks = self._get_context_chunks(book_id, chunk_id, seen_chunk_ids, namespace)
+                if include_context and chunk_id is not None and match_book_id is not None:
+                    context_chunks = self._get_context_chunks(match_book_id, chunk_id, seen_chunk_ids, namespace)
                     results.extend(context_chunks)
             
-            # Reorder results by original position if we added context
-            if include_context:
-                results.sort(key=lambda x: (x.get('page', 0), x.get('position', 0)))
-                # Limit to top_k after sorting
-                results = results[:top_k]
-                
+            results = self._order_results(results, include_context, top_k)
+            if self.semantic_cache is not None and results:
+                self.semantic_cache.store(cache_partition, query_embedding, results, generation)
             return results
             
         except Exception as e:
@@ -732,6 +2366,108 @@ class EnhancedBookEmbedder:
             traceback.print_exc()
             return []
 
+    def _plan_namespaces(self, book_id: str = None, chapter: str = None, chunk_type: str = None) -> List[Optional[str]]:
+        """Namespaces to query for the given filters, smallest partitions first"""
+        return self._plan(self.router, self.namespace, book_id, chapter, chunk_type)
+
+    @staticmethod
+    def _plan(router: NamespaceRouter, default_namespace: str, book_id: str = None, chapter: str = None,
+              chunk_type: str = None) -> List[Optional[str]]:
+        """Namespaces to query according to the given routing table"""
+        # Books written before routing existed use the old title-derived layout
+        if chunk_type == "mcq":
+            legacy = default_namespace
+        else:
+            legacy = EnhancedBookEmbedder._get_chapter_namespace(chapter) if chapter else None
+        
+        namespaces = router.plan(book_id, chapter, chunk_type)
+        if namespaces is None:
+            return [legacy]
+        if not book_id and legacy not in namespaces:
+            # The index may mix routed and unrouted books
+            namespaces.append(legacy)
+        return namespaces
+
+    def _query_namespaces(self, namespaces: List[Optional[str]], top_k: int, **query: Any) -> List[Tuple[Optional[str], Any]]:
+        """Run one query per namespace in parallel and merge the best top_k matches"""
+        def run(namespace):
+            response = _call_with_retry(
+                "Query", lambda: self.index.query(namespace=namespace, top_k=top_k, **query), PINECONE_READ_GOVERNOR
+            )
+            return [(namespace, match) for match in response['matches']]
+        
+        if len(namespaces) == 1:
+            scored = run(namespaces[0])
+        else:
+            with ThreadPoolExecutor(max_workers=min(8, len(namespaces) or 1)) as executor:
+                scored = [item for items in executor.map(run, namespaces) for item in items]
+        scored.sort(key=lambda item: item[1]['score'], reverse=True)
+        return scored[:top_k]
+
+    @staticmethod
+    def _match_result(match, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a search result from a query match and its hydrated metadata"""
+        return {
+            'text': metadata['text'],
+            'score': match['score'],
+            'page': metadata.get('page_num', 0),
+            'chapter': metadata.get('chapter', ''),
+            'section': metadata.get('section', ''),
+        }
+
+    @staticmethod
+    def _order_results(results: List[Dict[str, Any]], include_context: bool, top_k: int) -> List[Dict[str, Any]]:
+        """Reorder results by original position if context was added"""
+        if include_context:
+            results.sort(key=lambda x: (x.get('page', 0), x.get('position', 0)))
+            # Limit to top_k after sorting
+            results = results[:top_k]
+        return results
+
+    @staticmethod
+    def _context_filters(book_id: str, chunk_id: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Filters for chunks from the same book just before and just after a chunk"""
+        before_filter = {
+            "$and": [
+                {"book_id": {"$eq": book_id}},
+                {"chunk_id": {"$lt": chunk_id}},
+                {"chunk_id": {"$gte": max(0, chunk_id - 2)}}
+            ]
+        }
+        
+        after_filter = {
+            "$and": [
+                {"book_id": {"$eq": book_id}},
+                {"chunk_id": {"$gt": chunk_id}},
+                {"chunk_id": {"$lte": chunk_id + 2}}
+            ]
+        }
+        return before_filter, after_filter
+
+    @staticmethod
+    def _context_results(matches, metadata_list: List[Dict[str, Any]], seen_ids: set,
+                         namespace: str = None) -> List[Dict[str, Any]]:
+        """Build context results, skipping chunks that are already in the result set"""
+        context_results = []
+        for match, metadata in zip(matches, metadata_list):
+            context_chunk_id = (namespace, metadata.get('chunk_id'))
+            
+            # Skip if we've already seen this chunk
+            if context_chunk_id in seen_ids:
+                continue
+                
+            seen_ids.add(context_chunk_id)
+            
+            context_results.append({
+                'text': metadata['text'],
+                'score': 0.0,  # Context chunks don't have relevance scores
+                'page': metadata.get('page_num', 0),
+                'chapter': metadata.get('chapter', ''),
+                'section': metadata.get('section', ''),
+                'is_context': True
+            })
+        return context_results
+
     def _get_context_chunks(self, book_id: str, chunk_id: int, seen_ids: set, namespace: str = 'default') -> List[Dict[str, Any]]:
         """Get contextual chunks around the given chunk"""
         try:
@@ -739,59 +2475,30 @@ class EnhancedBookEmbedder:
             context_results = []
             
             # Filter for chunks from same book and close to the current chunk
-            before_filter = {
-                "$and": [
-                    {"book_id": {"$eq": book_id}},
-                    {"chunk_id": {"$lt": chunk_id}},
-                    {"chunk_id": {"$gte": max(0, chunk_id - 2)}}
-                ]
-            }
-            
-            after_filter = {
-                "$and": [
-                    {"book_id": {"$eq": book_id}},
-                    {"chunk_id": {"$gt": chunk_id}},
-                    {"chunk_id": {"$lte": chunk_id + 2}}
-                ]
-            }
+            before_filter, after_filter = self._context_filters(book_id, chunk_id)
             
             # Fetch surrounding chunks before
-            before_chunks = self.index.query(
+            before_chunks = _call_with_retry("Context query", lambda: self.index.query(
                 top_k=2,
                 include_metadata=True,
                 namespace=namespace,
                 filter=before_filter,
                 vector=None  # Metadata-only query
-            )
+            ), PINECONE_READ_GOVERNOR)
             
             # Fetch surrounding chunks after
-            after_chunks = self.index.query(
+            after_chunks = _call_with_retry("Context query", lambda: self.index.query(
                 top_k=2,
                 include_metadata=True,
                 namespace=namespace,
                 filter=after_filter,
                 vector=None  # Metadata-only query
-            )
+            ), PINECONE_READ_GOVERNOR)
             
             # Process context chunks
             for results in [before_chunks, after_chunks]:
-                for match in results.get('matches', []):
-                    context_chunk_id = match['metadata'].get('chunk_id')
-                    
-                    # Skip if we've already seen this chunk
-                    if context_chunk_id in seen_ids:
-                        continue
-                        
-                    seen_ids.add(context_chunk_id)
-                    
-                    context_results.append({
-                        'text': match['metadata']['text'],
-                        'score': 0.0,  # Context chunks don't have relevance scores
-                        'page': match['metadata'].get('page_num', 0),
-                        'chapter': match['metadata'].get('chapter', ''),
-                        'section': match['metadata'].get('section', ''),
-                        'is_context': True
-                    })
+                matches = results.get('matches', [])
+                context_results.extend(self._context_results(matches, self._hydrate_matches(matches), seen_ids, namespace))
             
             return context_results
             
@@ -818,63 +2525,59 @@ class EnhancedBookEmbedder:
                 return []
             
             # Set up search filters
-            filter_obj = {
-                "$and": [
-                    {"chunk_type": {"$eq": "mcq"}},
-                    {"book_id": {"$eq": book_id}} if book_id else {}
-                ]
-            }
+            filter_obj = self._mcq_filter(book_id)
             
-            # Perform search
-            search_results = self.index.query(
+            # Perform search over the namespaces that hold MCQs
+            scored = self._query_namespaces(
+                self._plan_namespaces(book_id, chunk_type="mcq"),
                 vector=query_embedding,
                 top_k=num_questions * 2,  # Get more results to filter
                 include_metadata=True,
-                namespace=self.namespace,
                 filter=filter_obj
             )
             
-            # Process results
-            mcqs = []
-            for match in search_results['matches']:
-                if match['score'] < 0.6:  # Similarity threshold
-                    continue
-                
-                mcq_data = match['metadata'].get('mcq_data', {})
-                if mcq_data:
-                    mcqs.append({
-                        'question': mcq_data['question'],
-                        'options': mcq_data['options'],
-                        'answer': mcq_data['answer'],
-                        'chapter': match['metadata'].get('chapter', ''),
-                        'section': match['metadata'].get('section', ''),
-                        'relevance_score': match['score']
-                    })
-                
-                if len(mcqs) >= num_questions:
-                    break
-            
-            return mcqs
+            return self._mcq_results([match for _, match in scored], self.sidecar, num_questions)
             
         except Exception as e:
             print(f"Error searching MCQs: {e}")
             traceback.print_exc()
             return []
 
-    def generate_quiz(self, topic: str, book_id: str = None, num_questions: int = 5) -> Dict[str, Any]:
-        """
-        Generate a quiz on a specific topic
-        
-        Args:
-            topic: The topic to generate a quiz about
-            book_id: Optional book ID to limit search to a specific book
-            num_questions: Number of questions in the quiz
+    @staticmethod
+    def _mcq_filter(book_id: str = None) -> Dict[str, Any]:
+        """Filter for MCQ chunks, optionally limited to one book"""
+        return {
+            "$and": [
+                {"chunk_type": {"$eq": "mcq"}},
+                {"book_id": {"$eq": book_id}} if book_id else {}
+            ]
+        }
+
+    @staticmethod
+    def _mcq_results(matches, sidecar: Optional[SidecarTextStore], num_questions: int) -> List[Dict[str, Any]]:
+        """Build MCQ results from query matches above the similarity threshold"""
+        mcqs = []
+        matches = [match for match in matches if match['score'] >= 0.6]  # Similarity threshold
+        for match, metadata in zip(matches, EnhancedBookEmbedder._hydrate(matches, sidecar)):
+            mcq_data = metadata.get('mcq_data', {})
+            if mcq_data:
+                mcqs.append({
+                    'question': mcq_data['question'],
+                    'options': mcq_data['options'],
+                    'answer': mcq_data['answer'],
+                    'chapter': metadata.get('chapter', ''),
+                    'section': metadata.get('section', ''),
+                    'relevance_score': match['score']
+                })
             
-        Returns:
-            Quiz with questions, options, and answers
-        """
-        mcqs = self.search_mcqs(topic, book_id, num_questions)
+            if len(mcqs) >= num_questions:
+                break
         
+        return mcqs
+
+    @staticmethod
+    def _quiz(topic: str, mcqs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Wrap MCQ search results as a quiz"""
         if not mcqs:
             return {
                 "error": f"No MCQs found for topic: {topic}",
@@ -888,22 +2591,773 @@ class EnhancedBookEmbedder:
             "generated_at": time.time()
         }
 
+    def generate_quiz(self, topic: str, book_id: str = None, num_questions: int = 5) -> Dict[str, Any]:
+        """
+        Generate a quiz on a specific topic
+        
+        Args:
+            topic: The topic to generate a quiz about
+            book_id: Optional book ID to limit search to a specific book
+            num_questions: Number of questions in the quiz
+            
+        Returns:
+            Quiz with questions, options, and answers
+        """
+        return self._quiz(topic, self.search_mcqs(topic, book_id, num_questions))
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python enhanced_book_embedder.py <document_path> <index_name> [book_id]")
+    def export_archive(self, archive_path: str, book_id: str = None, dtype: str = "int8",
+                       fetch_batch_size: int = 100) -> int:
+        """
+        Export stored vectors to a quantized archive
+        
+        Args:
+            archive_path: Destination .npz file
+            book_id: Optional book ID to export; exports the whole index if omitted
+            dtype: Storage type for vector values, "int8" or "float16"
+            fetch_batch_size: Number of IDs per fetch request
+            
+        Returns:
+            Number of vectors exported
+        """
+        if dtype not in EmbeddingArchive.SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported archive dtype: {dtype}")
+        
+        prefix = f"{book_id}_chunk_" if book_id else None
+        stats = self.index.describe_index_stats()
+        namespaces = list(stats['namespaces'].keys())
+        
+        ids, vector_namespaces, vectors, metadata = [], [], [], []
+        for namespace in namespaces:
+            for id_page in self.index.list(prefix=prefix, namespace=namespace):
+                for start in range(0, len(id_page), fetch_batch_size):
+                    batch_ids = id_page[start:start + fetch_batch_size]
+                    fetched = _call_with_retry(
+                        "Fetch", lambda: self.index.fetch(ids=batch_ids, namespace=namespace), PINECONE_READ_GOVERNOR
+                    )['vectors']
+                    records = [
+                        {'id': vector_id, 'metadata': fetched[vector_id].get('metadata')}
+                        for vector_id in batch_ids if vector_id in fetched
+                    ]
+                    # Archive the full payload so slim and full indexes can be swapped freely
+                    for record, record_metadata in zip(records, self._hydrate_matches(records)):
+                        ids.append(record['id'])
+                        vector_namespaces.append(namespace)
+                        vectors.append(fetched[record['id']]['values'])
+                        metadata.append(record_metadata)
+            print(f"Exported {len(ids)} vectors so far (namespace {namespace})")
+        
+        archive = EmbeddingArchive(ids, vector_namespaces, np.array(vectors, dtype=np.float32), metadata)
+        archive.save(archive_path, dtype=dtype)
+        print(f"Saved {len(archive)} vectors to {archive_path} ({dtype})")
+        return len(archive)
+
+    def import_archive(self, archive_path: str, namespace: str = None,
+                       max_batch_vectors: int = VectorUpsertStage.MAX_REQUEST_VECTORS,
+                       max_workers: int = 8) -> Tuple[int, int]:
+        """
+        Bulk-import a quantized archive into this index without re-embedding
+        
+        Args:
+            archive_path: Archive written by export_archive
+            namespace: Optional namespace for all vectors; keeps the archived namespaces if omitted
+            max_batch_vectors: Upper bound on vectors per upsert request; requests are also capped by size
+            max_workers: Number of upserts in flight at once per namespace
+            
+        Returns:
+            Tuple of (imported, failed) vector counts
+        """
+        archive = EmbeddingArchive.load(archive_path)
+        print(f"Loaded {len(archive)} vectors from {archive_path}")
+        
+        # One upsert stage per target namespace, all sending in parallel
+        stages: Dict[str, VectorUpsertStage] = {}
+        route_counts = defaultdict(lambda: [0, 0])
+        for vector_id, source_namespace, values, record_metadata in zip(
+                archive.ids, archive.namespaces, archive.vectors, archive.metadata):
+            target_namespace = namespace or source_namespace
+            if record_metadata.get("book_id"):
+                route = (record_metadata["book_id"], record_metadata.get("chapter") or 'default', target_namespace)
+                route_counts[route][0] += 1
+                route_counts[route][1] += record_metadata.get("chunk_type") == "mcq"
+            if target_namespace not in stages:
+                stages[target_namespace] = VectorUpsertStage(
+                    self.index, target_namespace, sidecar=self.sidecar,
+                    max_batch_vectors=max_batch_vectors, max_workers=max_workers
+                )
+            sidecar_records = {}
+            stages[target_namespace].add({
+                "id": vector_id,
+                "values": values.tolist(),
+                "metadata": self._index_metadata(vector_id, record_metadata, sidecar_records)
+            }, sidecar_records.get(vector_id))
+        
+        for stage in stages.values():
+            stage.flush()
+        
+        imported = 0
+        failed = 0
+        for target_namespace, stage in stages.items():
+            succeeded, stage_failed = stage.close()
+            imported += succeeded
+            failed += stage_failed
+            print(f"Progress: {imported + failed}/{len(archive)} vectors (namespace {target_namespace})")
+        
+        # Register the imported chapters so searches can route to them
+        for (book_id, chapter, target_namespace), (vector_count, mcq_count) in route_counts.items():
+            self.router.assign(book_id, chapter, target_namespace, vector_count, mcq_count)
+        if self.semantic_cache is not None:
+            for book_id in {book_id for book_id, _, _ in route_counts}:
+                self.semantic_cache.invalidate(book_id, self.index_name)
+        
+        print(f"Import complete: {imported} imported, {failed} failed")
+        return imported, failed
+
+
+class AsyncEnhancedBookEmbedder:
+    """
+    Non-blocking search over an existing index for use inside an asyncio server
+    
+    Embedding and index calls are awaited rather than run on threads, paced by
+    the same rate governors as ingestion, retries back off with asyncio.sleep,
+    and a single index connection is reused for every request. Use as an async context manager:
+    
+        async with AsyncEnhancedBookEmbedder('physics') as embedder:
+            results = await embedder.semantic_search("define displacement", timeout=5)
+    """
+
+    def __init__(self, index_name='enhanced-book-embeddings', namespace='default', sidecar_dir: str = 'sidecar',
+                 max_concurrency: int = 64, request_timeout: float = 10.0, max_retries: int = 3,
+                 semantic_cache: Optional[SemanticQueryCache] = None, routing_db: str = 'routes.db'):
+        self.index_name = index_name
+        self.namespace = namespace
+        self.semantic_cache = semantic_cache
+        self.router = NamespaceRouter(index_name, routing_db)
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.index = None
+        # Bounds in-flight API calls; searches beyond this wait instead of piling onto the APIs
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        
+        sidecar_path = os.path.join(sidecar_dir, index_name)
+        self.sidecar = SidecarTextStore(sidecar_path) if SidecarTextStore.exists(sidecar_path) else None
+
+    async def connect(self) -> None:
+        """Open the shared async index connection"""
+        if self.index is not None:
+            return
+        # The asyncio client only exists from pinecone 6 with the asyncio extra
+        if not hasattr(pc, 'IndexAsyncio'):
+            raise RuntimeError(
+                "AsyncEnhancedBookEmbedder needs pinecone>=6 with asyncio support: "
+                "pip install 'pinecone[asyncio]>=6.0.0'"
+            )
+        # Resolving the host is a one-off control-plane call, so it can run on a thread
+        description = await asyncio.to_thread(pc.describe_index, self.index_name)
+        self.index = pc.IndexAsyncio(host=description.host)
+
+    async def close(self) -> None:
+        if self.index is not None:
+            await self.index.close()
+            self.index = None
+
+    async def __aenter__(self) -> 'AsyncEnhancedBookEmbedder':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def _with_retry(self, description: str, call: Callable[[], Any], governor: RateGovernor) -> Any:
+        """Await call() under the concurrency limit and governor with a per-request timeout and async backoff"""
+        for attempt in range(self.max_retries):
+            await governor.acquire_async()
+            try:
+                async with self._semaphore:
+                    result = await asyncio.wait_for(call(), self.request_timeout)
+                governor.on_success()
+                return result
+            except Exception as e:
+                print(f"{description} attempt {attempt + 1} failed: {e!r}")
+                retry_after = _retry_after(e)
+                if _is_throttled(e):
+                    governor.on_throttle(retry_after)
+                if attempt == self.max_retries - 1 or not _is_retryable(e) or not governor.try_retry():
+                    raise
+                await asyncio.sleep(governor.backoff(attempt, retry_after))
+
+    async def _generate_embedding_with_retry(self, text: str) -> Optional[List[float]]:
+        """Generate an embedding without blocking the event loop"""
+        try:
+            result = await self._with_retry(
+                "Embedding",
+                lambda: genai.embed_content_async(model="models/embedding-001", content=text),
+                GEMINI_GOVERNOR
+            )
+            return result['embedding']
+        except Exception:
+            print("Failed to generate embedding after all retries")
+            return None
+
+    async def _query(self, **kwargs) -> Any:
+        if self.index is None:
+            await self.connect()
+        # Leave the namespace out rather than sending None, matching the sync client's default
+        if kwargs.get('namespace') is None:
+            kwargs.pop('namespace', None)
+        return await self._with_retry("Query", lambda: self.index.query(**kwargs), PINECONE_READ_GOVERNOR)
+
+    async def semantic_search(self, query: str, book_id: str = None, chapter: str = None, top_k: int = 5,
+                              include_context: bool = True, similarity_cutoff: float = 0.6,
+                              timeout: float = None) -> List[Dict[str, Any]]:
+        """
+        Async counterpart of EnhancedBookEmbedder.semantic_search
+        
+        Args:
+            timeout: Optional overall deadline in seconds; raises TimeoutError when exceeded
+            
+        Other arguments and the return value match the sync method.
+        """
+        return await asyncio.wait_for(
+            self._semantic_search(query, book_id, chapter, top_k, include_context, similarity_cutoff),
+            timeout
+        )
+
+    async def _semantic_search(self, query: str, book_id: str, chapter: str, top_k: int,
+                               include_context: bool, similarity_cutoff: float) -> List[Dict[str, Any]]:
+        try:
+            query_embedding = await self._generate_embedding_with_retry(query)
+            if query_embedding is None:
+                return []
+            
+            cache_partition = SemanticQueryCache.partition(
+                self.index_name, book_id, chapter,
+                top_k=top_k, include_context=include_context, similarity_cutoff=similarity_cutoff
+            )
+            if self.semantic_cache is not None:
+                generation = await asyncio.to_thread(self.router.generation, book_id)
+                cached_results = self.semantic_cache.lookup(cache_partition, query_embedding, generation)
+                if cached_results is not None:
+                    return cached_results
+            
+            filter_obj = {"book_id": {"$eq": book_id}} if book_id else None
+            # Planning reads the SQLite routing table, so keep it off the event loop
+            namespaces = await asyncio.to_thread(
+                EnhancedBookEmbedder._plan, self.router, self.namespace, book_id, chapter
+            )
+            
+            scored = await self._query_namespaces(
+                namespaces,
+                vector=query_embedding,
+                top_k=top_k if not include_context else top_k * 2,
+                include_metadata=True,
+                filter=filter_obj
+            )
+            
+            scored = [(namespace, match) for namespace, match in scored if match['score'] >= similarity_cutoff]
+            metadata_list = EnhancedBookEmbedder._hydrate([match for _, match in scored], self.sidecar)
+            results = [EnhancedBookEmbedder._match_result(match, metadata)
+                       for (_, match), metadata in zip(scored, metadata_list)]
+            
+            if include_context:
+                seen_chunk_ids = {(namespace, metadata.get('chunk_id'))
+                                  for (namespace, _), metadata in zip(scored, metadata_list)}
+                anchors = [(namespace, metadata) for (namespace, _), metadata in zip(scored, metadata_list)
+                           if metadata.get('chunk_id') is not None and metadata.get('book_id') is not None]
+                # Fetch context for all matches concurrently
+                context_lists = await asyncio.gather(*[
+                    self._get_context_matches(metadata['book_id'], metadata['chunk_id'], namespace)
+                    for namespace, metadata in anchors
+                ])
+                for (namespace, _), context_matches in zip(anchors, context_lists):
+                    results.extend(EnhancedBookEmbedder._context_results(
+                        context_matches, EnhancedBookEmbedder._hydrate(context_matches, self.sidecar),
+                        seen_chunk_ids, namespace
+                    ))
+            
+            results = EnhancedBookEmbedder._order_results(results, include_context, top_k)
+            if self.semantic_cache is not None and results:
+                self.semantic_cache.store(cache_partition, query_embedding, results, generation)
+            return results
+            
+        except Exception as e:
+            print(f"Search error: {e}")
+            traceback.print_exc()
+            return []
+
+    async def _query_namespaces(self, namespaces: List[Optional[str]], top_k: int,
+                                **query: Any) -> List[Tuple[Optional[str], Any]]:
+        """Query all namespaces concurrently and merge the best top_k matches"""
+        async def run(namespace):
+            response = await self._query(namespace=namespace, top_k=top_k, **query)
+            return [(namespace, match) for match in response['matches']]
+        
+        scored = [item for items in await asyncio.gather(*[run(namespace) for namespace in namespaces])
+                  for item in items]
+        scored.sort(key=lambda item: item[1]['score'], reverse=True)
+        return scored[:top_k]
+
+    async def _get_context_matches(self, book_id: str, chunk_id: int, namespace: str = None) -> List[Any]:
+        """Query the chunks around the given chunk, before and after in parallel"""
+        try:
+            before_filter, after_filter = EnhancedBookEmbedder._context_filters(book_id, chunk_id)
+            before_chunks, after_chunks = await asyncio.gather(
+                self._query(top_k=2, include_metadata=True, namespace=namespace, filter=before_filter, vector=None),
+                self._query(top_k=2, include_metadata=True, namespace=namespace, filter=after_filter, vector=None)
+            )
+            return list(before_chunks.get('matches', [])) + list(after_chunks.get('matches', []))
+        except Exception as e:
+            print(f"Error getting context chunks: {e}")
+            return []
+
+    async def search_mcqs(self, topic: str, book_id: str = None, num_questions: int = 5,
+                          timeout: float = None) -> List[Dict[str, Any]]:
+        """Async counterpart of EnhancedBookEmbedder.search_mcqs"""
+        return await asyncio.wait_for(self._search_mcqs(topic, book_id, num_questions), timeout)
+
+    async def _search_mcqs(self, topic: str, book_id: str, num_questions: int) -> List[Dict[str, Any]]:
+        try:
+            query_embedding = await self._generate_embedding_with_retry(topic)
+            if query_embedding is None:
+                return []
+            
+            namespaces = await asyncio.to_thread(
+                EnhancedBookEmbedder._plan, self.router, self.namespace, book_id, chunk_type="mcq"
+            )
+            scored = await self._query_namespaces(
+                namespaces,
+                vector=query_embedding,
+                top_k=num_questions * 2,
+                include_metadata=True,
+                filter=EnhancedBookEmbedder._mcq_filter(book_id)
+            )
+            return EnhancedBookEmbedder._mcq_results([match for _, match in scored], self.sidecar, num_questions)
+            
+        except Exception as e:
+            print(f"Error searching MCQs: {e}")
+            traceback.print_exc()
+            return []
+
+    async def generate_quiz(self, topic: str, book_id: str = None, num_questions: int = 5,
+                            timeout: float = None) -> Dict[str, Any]:
+        """Async counterpart of EnhancedBookEmbedder.generate_quiz"""
+        mcqs = await self.search_mcqs(topic, book_id, num_questions, timeout=timeout)
+        return EnhancedBookEmbedder._quiz(topic, mcqs)
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of ingestion jobs, shared between enqueuers, workers and status readers
+    
+    A running job records the worker that claimed it and a heartbeat the
+    worker refreshes while it is alive, so several workers can share one
+    database and only jobs whose worker has stopped heartbeating are requeued.
+    """
+    
+    STATUSES = ("queued", "running", "completed", "failed")
+
+    def __init__(self, db_path: str = 'jobs.db'):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_path TEXT NOT NULL,
+                    index_name TEXT NOT NULL,
+                    book_id TEXT,
+                    slim_metadata INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    chunks_processed INTEGER NOT NULL DEFAULT 0,
+                    total_chunks INTEGER NOT NULL DEFAULT 0,
+                    message TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    worker_id TEXT,
+                    heartbeat_at REAL
+                )
+            """)
+            # Queues created before heartbeats lack the worker columns
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("worker_id", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps the queue safe to use from any thread
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, file_path: str, index_name: str, book_id: str = None, slim_metadata: bool = False) -> int:
+        """Add a job and return its ID"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (file_path, index_name, book_id, slim_metadata, created_at) VALUES (?, ?, ?, ?, ?)",
+                (os.path.abspath(file_path), index_name, book_id, int(slim_metadata), time.time())
+            )
+            return cursor.lastrowid
+
+    def claim_next(self, worker_id: str = None) -> Optional[Dict[str, Any]]:
+        """Atomically mark the oldest queued job as running by worker_id and return it"""
+        with self._connect() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, worker_id = ?, message = ? "
+                    "WHERE id = ?",
+                    (now, now, worker_id, "Started", row["id"])
+                )
+                # Return the claimed row, not the one read before the update
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return dict(row)
+
+    def update_progress(self, job_id: int, chunks_processed: int, total_chunks: int, message: str = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET chunks_processed = ?, total_chunks = ?, message = COALESCE(?, message), "
+                "heartbeat_at = ? WHERE id = ?",
+                (chunks_processed, total_chunks, message, time.time(), job_id)
+            )
+
+    def finish(self, job_id: int, status: str, message: str = None, book_id: str = None) -> None:
+        if status not in self.STATUSES:
+            raise ValueError(f"Unknown job status: {status}")
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, book_id = COALESCE(?, book_id), finished_at = ? WHERE id = ?",
+                (status, message, book_id, time.time(), job_id)
+            )
+
+    def heartbeat(self, worker_id: str) -> None:
+        """Mark the worker's running jobs as still alive"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND worker_id = ?",
+                (time.time(), worker_id)
+            )
+
+    def requeue_stale(self, stale_after: float) -> int:
+        """Put running jobs whose worker has not heartbeated for stale_after seconds back in the queue"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, message = 'Requeued after worker stopped' "
+                "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at, 0) < ?",
+                (time.time() - stale_after,)
+            )
+            return cursor.rowcount
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._with_percentage(dict(row)) if row else None
+
+    def list_jobs(self, status: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit))
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+            return [self._with_percentage(dict(row)) for row in rows.fetchall()]
+
+    @staticmethod
+    def _with_percentage(job: Dict[str, Any]) -> Dict[str, Any]:
+        total = job["total_chunks"]
+        job["percentage"] = (job["chunks_processed"] / total * 100) if total else 0.0
+        return job
+
+
+class IngestionWorker:
+    """Long-running worker that serves the job queue with warm embedders"""
+
+    def __init__(self, queue: JobQueue, concurrency: int = 2, poll_interval: float = 1.0,
+                 sidecar_dir: str = 'sidecar', progress_interval: float = 1.0,
+                 heartbeat_interval: float = None, stale_after: float = 120.0):
+        # Heartbeats are sent from the poll loop, so they can be up to a poll interval late
+        heartbeat_interval = heartbeat_interval or min(10.0, stale_after / 3)
+        if stale_after < 2 * max(heartbeat_interval, poll_interval):
+            raise ValueError(
+                f"stale_after ({stale_after}s) must be at least twice the heartbeat and poll intervals "
+                f"({heartbeat_interval}s, {poll_interval}s), or live jobs would be requeued"
+            )
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.sidecar_dir = sidecar_dir
+        self.progress_interval = progress_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._embedders: Dict[Tuple[str, bool], EnhancedBookEmbedder] = {}
+        self._embedders_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _get_embedder(self, index_name: str, slim_metadata: bool) -> EnhancedBookEmbedder:
+        """Return a connected embedder for the index, creating it on first use"""
+        key = (index_name, slim_metadata)
+        with self._embedders_lock:
+            if key not in self._embedders:
+                self._embedders[key] = EnhancedBookEmbedder(
+                    index_name=index_name,
+                    slim_metadata=slim_metadata,
+                    sidecar_dir=self.sidecar_dir
+                )
+            return self._embedders[key]
+
+    def _run_job(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        print(f"[job {job_id}] Processing {job['file_path']} into {job['index_name']}")
+        last_update = 0.0
+
+        def report(chunks_processed: int, total_chunks: int) -> None:
+            nonlocal last_update
+            now = time.time()
+            # Throttle writes; always record the final chunk
+            if now - last_update >= self.progress_interval or chunks_processed == total_chunks:
+                self.queue.update_progress(job_id, chunks_processed, total_chunks,
+                                           f"Progress: {chunks_processed}/{total_chunks} chunks")
+                last_update = now
+
+        try:
+            embedder = self._get_embedder(job["index_name"], bool(job["slim_metadata"]))
+            book_id = embedder.process_document(job["file_path"], job["book_id"], progress_callback=report)
+            if book_id:
+                self.queue.finish(job_id, "completed", "File processed successfully", book_id=book_id)
+            else:
+                self.queue.finish(job_id, "failed", "No valid content found")
+        except Exception as e:
+            traceback.print_exc()
+            self.queue.finish(job_id, "failed", str(e))
+        print(f"[job {job_id}] Finished")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        """Claim and run jobs until stopped, with at most `concurrency` jobs in flight"""
+        print(f"Worker {self.worker_id} started (concurrency={self.concurrency}, queue={self.queue.db_path})")
+
+        active = set()
+        last_heartbeat = 0.0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                while not self._stop.is_set():
+                    now = time.time()
+                    if now - last_heartbeat >= self.heartbeat_interval:
+                        # Keep our own jobs alive, then take over jobs from workers that stopped
+                        self.queue.heartbeat(self.worker_id)
+                        requeued = self.queue.requeue_stale(self.stale_after)
+                        if requeued:
+                            print(f"Requeued {requeued} interrupted job(s)")
+                        last_heartbeat = now
+                    active = {future for future in active if not future.done()}
+                    job = self.queue.claim_next(self.worker_id) if len(active) < self.concurrency else None
+                    if job is None:
+                        self._stop.wait(self.poll_interval)
+                        continue
+                    active.add(executor.submit(self._run_job, job))
+            except KeyboardInterrupt:
+                print("Stopping worker; waiting for running jobs to finish...")
+
+
+def _worker_command(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bookembedder.py worker",
+                                     description="Serve the ingestion job queue")
+    parser.add_argument("--db", default="jobs.db", help="Job queue database (default: jobs.db)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs processed at once")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between queue polls when idle")
+    parser.add_argument("--sidecar-dir", default="sidecar")
+    parser.add_argument("--stale-after", type=float, default=120.0,
+                        help="Requeue running jobs whose worker has not heartbeated for this many seconds")
+    args = parser.parse_args(argv)
+    
+    try:
+        worker = IngestionWorker(
+            JobQueue(args.db),
+            concurrency=args.concurrency,
+            poll_interval=args.poll_interval,
+            sidecar_dir=args.sidecar_dir,
+            stale_after=args.stale_after
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    worker.run()
+
+
+def _enqueue_command(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bookembedder.py enqueue",
+                                     description="Queue a document for the ingestion worker")
+    parser.add_argument("document_path")
+    parser.add_argument("index_name")
+    parser.add_argument("book_id", nargs="?", default=None)
+    parser.add_argument("--slim-metadata", action="store_true")
+    parser.add_argument("--db", default="jobs.db")
+    args = parser.parse_args(argv)
+    
+    job_id = JobQueue(args.db).enqueue(args.document_path, args.index_name, args.book_id, args.slim_metadata)
+    print(json.dumps({"job_id": job_id}))
+
+
+def _status_command(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bookembedder.py status",
+                                     description="Print job status and progress as JSON")
+    parser.add_argument("job_id", nargs="?", type=int, default=None)
+    parser.add_argument("--status", choices=JobQueue.STATUSES, default=None, help="Filter the job list by status")
+    parser.add_argument("--db", default="jobs.db")
+    args = parser.parse_args(argv)
+    
+    queue = JobQueue(args.db)
+    if args.job_id is not None:
+        job = queue.get(args.job_id)
+        if job is None:
+            print(json.dumps({"error": f"Job {args.job_id} not found"}))
+            sys.exit(1)
+        print(json.dumps(job, indent=2))
+    else:
+        print(json.dumps(queue.list_jobs(args.status), indent=2))
+
+
+def _routes_command(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bookembedder.py routes",
+                                     description="Print the namespace routing table of an index as JSON")
+    parser.add_argument("index_name")
+    parser.add_argument("--book-id", default=None)
+    parser.add_argument("--db", default="routes.db")
+    args = parser.parse_args(argv)
+    
+    print(json.dumps(NamespaceRouter(args.index_name, args.db).routes(args.book_id), indent=2))
+
+
+def _export_command(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bookembedder.py export",
+                                     description="Export stored vectors to a quantized archive")
+    parser.add_argument("index_name")
+    parser.add_argument("archive_path")
+    parser.add_argument("--book-id", default=None, help="Export only this book (default: whole index)")
+    parser.add_argument("--dtype", choices=EmbeddingArchive.SUPPORTED_DTYPES, default="int8")
+    parser.add_argument("--sidecar-dir", default="sidecar")
+    args = parser.parse_args(argv)
+    
+    book_embedder = EnhancedBookEmbedder(index_name=args.index_name, sidecar_dir=args.sidecar_dir)
+    book_embedder.export_archive(args.archive_path, book_id=args.book_id, dtype=args.dtype)
+
+
+def _import_command(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bookembedder.py import",
+                                     description="Import a quantized archive into an index")
+    parser.add_argument("archive_path")
+    parser.add_argument("index_name")
+    parser.add_argument("--namespace", default=None, help="Target namespace (default: keep archived namespaces)")
+    parser.add_argument("--workers", type=int, default=8, help="Parallel upsert requests")
+    parser.add_argument("--slim-metadata", action="store_true")
+    parser.add_argument("--sidecar-dir", default="sidecar")
+    args = parser.parse_args(argv)
+    
+    book_embedder = EnhancedBookEmbedder(
+        index_name=args.index_name,
+        slim_metadata=args.slim_metadata,
+        sidecar_dir=args.sidecar_dir
+    )
+    _, failed = book_embedder.import_archive(args.archive_path, namespace=args.namespace, max_workers=args.workers)
+    if failed:
         sys.exit(1)
+
+
+def _bench_pdf_command(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bookembedder.py bench-pdf",
+                                     description="Compare PDF extraction engines on speed and output parity")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--engines", nargs="+", choices=list(PDF_EXTRACTORS), default=None)
+    parser.add_argument("--repeat", type=int, default=1, help="Extraction runs per engine")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    
+    report = benchmark_pdf_engines(args.pdf_path, args.engines, args.repeat)
+    print(f"{'engine':<10} {'pages':>6} {'seconds':>9} {'pages/s':>9} {'parity':>8}")
+    for row in report:
+        if not row["available"]:
+            print(f"{row['engine']:<10} not installed")
+            continue
+        print(f"{row['engine']:<10} {row['pages']:>6} {row['seconds']:>9} {row['pages_per_second']:>9} {row['word_parity']:>8}")
+    print(json.dumps(report, indent=2))
+
+
+def _bench_memory_command(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bookembedder.py bench-memory",
+                                     description="Compare memory used by chunk representations")
+    parser.add_argument("document_path", nargs="?", default=None,
+                        help="Benchmark the chunks of this document instead of synthetic ones")
+    parser.add_argument("--chunks", type=int, default=100_000, help="Number of synthetic chunks")
+    args = parser.parse_args(argv)
+    
+    chunks = None
+    if args.document_path:
+        chunks, _ = TextProcessor.extract_structure(DocumentParser.parse_document(args.document_path))
+    report = benchmark_chunk_memory(chunks, args.chunks)
+    print(f"{'representation':<30} {'chunks':>8} {'MB':>8} {'B/chunk':>9} {'peak MB':>8} {'seconds':>8}")
+    for row in report:
+        print(f"{row['representation']:<30} {row['chunks']:>8} {row['bytes'] / 1e6:>8.1f} "
+              f"{row['bytes_per_chunk']:>9} {row['peak_bytes'] / 1e6:>8.1f} {row['seconds']:>8}")
+
+
+COMMANDS = {
+    "export": _export_command,
+    "import": _import_command,
+    "worker": _worker_command,
+    "enqueue": _enqueue_command,
+    "status": _status_command,
+    "routes": _routes_command,
+    "bench-pdf": _bench_pdf_command,
+    "bench-memory": _bench_memory_command,
+}
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
     
-    document_path = sys.argv[1]
-    index_name = sys.argv[2]
-    book_id = sys.argv[3] if len(sys.argv) > 3 else None
+    parser = argparse.ArgumentParser(description="Embed a document into a Pinecone index")
+    parser.add_argument("document_path")
+    parser.add_argument("index_name")
+    parser.add_argument("book_id", nargs="?", default=None)
+    parser.add_argument("--slim-metadata", action="store_true",
+                        help="Store only filterable fields in the index and keep text in a local sidecar store")
+    parser.add_argument("--sidecar-dir", default="sidecar",
+                        help="Directory for the sidecar text store (default: sidecar)")
+    parser.add_argument("--pdf-engine", choices=list(PDF_EXTRACTORS), default=None,
+                        help="PDF extraction engine (default: $PDF_ENGINE or pypdf2)")
+    parser.add_argument("--no-page-cache", action="store_true",
+                        help="Always re-extract PDF pages instead of using the page cache")
+    args = parser.parse_args()
     
     # Initialize embedder with provided index name
-    book_embedder = EnhancedBookEmbedder(index_name=index_name, namespace='default')
+    book_embedder = EnhancedBookEmbedder(
+        index_name=args.index_name,
+        namespace='default',
+        slim_metadata=args.slim_metadata,
+        sidecar_dir=args.sidecar_dir,
+        pdf_engine=args.pdf_engine,
+        page_cache_dir=None if args.no_page_cache else '.page_cache'
+    )
     
     # Process document
-    print(f"\nProcessing document: {document_path}")
-    book_id = book_embedder.process_document(document_path, book_id)
+    print(f"\nProcessing document: {args.document_path}")
+    book_id = book_embedder.process_document(args.document_path, args.book_id)
     
     if book_id:
         print(f"\nProcessing complete for book ID: {book_id}!")